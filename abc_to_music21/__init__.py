@@ -28,17 +28,33 @@ the tools from `abcplus <https://abcplus.sourceforge.net>`_.
 """
 
 __all__ = [
-    'abc_translator', 'tokenize', 'Field', 'Token', 'ABC2M21_CONFIG', 'ABCVersion',
+    'abc_translator', 'iter_abc_tunes', 'read_abc_headers', 'translate_tune', 'translate_tunes',
+    'translate_tune_batch', 'translate_fragment', 'tokenize', 'tokenize_bytes', 'tokenize_file',
+    'tokenize_stream', 'tokenize_table', 'Field', 'Token', 'TokenTable', 'IncrementalTokenizer',
+    'ABC2M21_CONFIG', 'ABCVersion',
 ]
 
+import io
+import pickle
 import re
-from pathlib import Path
-from music21 import stream, environment
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, NamedTuple, TextIO, TYPE_CHECKING
+from music21 import stream, environment, metadata, key, meter, tempo, sites, spanner
 from abc_to_music21.parser import ABC2M21_CONFIG, ABCException, FileHeader, TuneHeader, TuneBody
-from abc_to_music21.tokens import tokenize, Field, Token, DEFAULT_VERSION, ABCVersion
+from abc_to_music21.sources import AbcSource, iter_abc_books
+from abc_to_music21.tokens import tokenize, tokenize_bytes, tokenize_file, tokenize_stream
+from abc_to_music21.tokens import tokenize_table
+from abc_to_music21.tokens import Field, IncrementalTokenizer, Token, TokenTable
+from abc_to_music21.tokens import DEFAULT_VERSION, ABCVersion
+
+if TYPE_CHECKING:
+    from abc_to_music21.cache import ScoreCache
 
 # Some regular expressions to split the abc data
 ABC_TUNE_BOOK_SPLIT = re.compile(r'(^X:.*$)', flags=re.MULTILINE).split
+RE_X_FIELD = re.compile(r'^X:.*$', flags=re.MULTILINE)
+RE_KEY_FIELD = re.compile(r'^K:.*$', flags=re.MULTILINE)
 ABC_VERSION_SPLIT = re.compile(r'[ \n]*(%abc-\d+.*)\n', flags=re.MULTILINE).split
 RE_MACRO = re.compile(r'^m:.*\n|\[m:[^\]]*\]', flags=re.MULTILINE)
 
@@ -47,6 +63,9 @@ def apply_macros(src: str, macros: dict[str, str] | None = None) -> (str, dict[s
     """
     Apply macros to the source string.
 
+    The macros are expanded in a single pass over the text by a matcher
+    compiled once per set of macros (see :func:`~compile_macros`).
+
     Args:
         src (str): The source string to apply macros to.
         macros (dict[str, str] | None): A dictionary containing macros and their replacements.
@@ -54,6 +73,9 @@ def apply_macros(src: str, macros: dict[str, str] | None = None) -> (str, dict[s
     Returns:
         Tuple[str, dict[str, str]]: A tuple containing the modified source string and the
                                     updated macros.
+
+    >>> apply_macros('m: ~n2 = (3o/n/m/n/\\nm: ~C = {g}C\\n~G2 ~c2 ~C')
+    ('(3A/G/F/G/ (3d/c/B/c/ {g}C', {'~n2': '(3o/n/m/n/', '~C': '{g}C'})
     """
 
     # Start position of the current match
@@ -62,17 +84,14 @@ def apply_macros(src: str, macros: dict[str, str] | None = None) -> (str, dict[s
     # List to store sections between macro definitions
     sections = []
     macros: dict[str, str] = {} if macros is None else dict(macros)
-
-    def replace(t: str):
-        for pattern, replacement in macros.items():
-            t = t.replace(pattern, replacement)
-        return t
+    replace = compile_macros(macros)
 
     # Iterate over the found matches
     for match in RE_MACRO.finditer(src):
         sections.append(replace(src[start_pos:match.start()]))
         k, v = match.group().lstrip('[').rstrip(']').strip('m:').strip().split('=')
         macros[k.strip()] = replace(v).strip()
+        replace = compile_macros(macros)
         start_pos = match.end()
 
     # Add the remaining text at the end
@@ -80,6 +99,95 @@ def apply_macros(src: str, macros: dict[str, str] | None = None) -> (str, dict[s
     return "".join(sections), macros
 
 
+# A note in the target of a transposing macro, without accidentals
+TRANSPOSING_NOTE = r"[A-Ga-g][,']*"
+# Parts of the replacement of a transposing macro, the letters h-z are notes
+RE_MACRO_REPLACEMENT = re.compile(r'"[^"]*"|![^!]*!|\+[^+]*\+|[h-z]')
+DIATONIC_STEPS = 'CDEFGABcdefgab'
+
+
+def transpose_note(note: str, steps: int) -> str:
+    """
+    Transpose a note (without accidentals) by diatonic steps.
+
+    >>> transpose_note('G', 1), transpose_note('B', 1), transpose_note("c'", -2)
+    ('A', 'c', 'a')
+    >>> transpose_note('b', 2), transpose_note('C', -1), transpose_note('C,', 0)
+    ("d'", 'B,', 'C,')
+    """
+    pitch = DIATONIC_STEPS.index(note[0]) + 7 * (note.count("'") - note.count(',')) + steps
+    if pitch < 0:
+        return DIATONIC_STEPS[pitch % 7] + ',' * (-(pitch // 7))
+    if pitch >= 14:
+        return DIATONIC_STEPS[7 + pitch % 7] + "'" * (pitch // 7 - 1)
+    return DIATONIC_STEPS[pitch]
+
+
+def _transposing_replacement(replacement: str) -> Callable[[str], str]:
+    # Split the replacement once, text parts are kept and placeholders transposed
+    parts: list[str | int] = []
+    start = 0
+    for match in RE_MACRO_REPLACEMENT.finditer(replacement):
+        parts.append(replacement[start:match.start()])
+        text = match.group()
+        parts.append(ord(text) - ord('n') if len(text) == 1 else text)
+        start = match.end()
+    parts.append(replacement[start:])
+
+    def replace(note: str) -> str:
+        return ''.join(part if isinstance(part, str) else transpose_note(note, part)
+                       for part in parts)
+
+    return replace
+
+
+@lru_cache(maxsize=64)
+def _compile_macros(macros: tuple[tuple[str, str], ...]) -> Callable[[str], str]:
+    macros = tuple((target, replacement) for target, replacement in macros if target)
+    if not macros:
+        return str
+
+    # The longest target wins, static macros before transposing macros of the same length
+    targets = sorted(enumerate(macros), key=lambda m: (-len(m[1][0]), 'n' in m[1][0], m[0]))
+    patterns = []
+    replacements: dict[str, Callable[[re.Match], str]] = {}
+    for i, (target, replacement) in targets:
+        group = f'm{i}'
+        if 'n' in target:
+            before, _, after = target.partition('n')
+            patterns.append(f'(?P<{group}>{re.escape(before)}(?P<n{i}>{TRANSPOSING_NOTE})'
+                            f'{re.escape(after)})')
+            replacements[group] = lambda m, r=_transposing_replacement(replacement), n=f'n{i}': \
+                r(m.group(n))
+        else:
+            patterns.append(f'(?P<{group}>{re.escape(target)})')
+            replacements[group] = lambda m, r=replacement: r
+
+    # The lookahead on the first characters lets the scanner skip text without macros fast
+    first_chars = ''.join(sorted({'A-Ga-g' if target.startswith('n') else re.escape(target[0])
+                                  for target, _ in macros}))
+    sub = re.compile(f"(?=[{first_chars}])(?:{'|'.join(patterns)})").sub
+    return lambda text: sub(lambda m: replacements[m.lastgroup](m), text)
+
+
+def compile_macros(macros: dict[str, str]) -> Callable[[str], str]:
+    """
+    Compile the macros into a function expanding all macros in a single pass
+    over a text. The compiled function is cached and shared by all tunes
+    using the same macros.
+
+    A macro with the letter 'n' in its target is a transposing macro (abc 2.1),
+    'n' matches a note and the letters h-z in the replacement are replaced by
+    this note transposed by diatonic steps, 'n' by the note itself, 'o' by the
+    note above, 'm' by the note below and so on.
+
+    >>> expand = compile_macros({'~n2': '{o}n{m}n', 'T': '!trill!'})
+    >>> expand('~D2 T~a2')
+    '{E}D{C}D !trill!{b}a{g}a'
+    """
+    return _compile_macros(tuple(macros.items()))
+
+
 def split_abc_data(src: str) -> (str, list[str], ABCVersion):
     """
     Split ABC data into the abc file header, individual ABC tunes and
@@ -93,6 +201,21 @@ def split_abc_data(src: str) -> (str, list[str], ABCVersion):
     (after extracting tunes), a list of individual ABC tunes, and the ABC version.
     """
     src, *abc_tunes = ABC_TUNE_BOOK_SPLIT(src)
+    src, version = split_abc_version(src)
+    return src, abc_tunes, version
+
+
+def split_abc_version(src: str) -> (str, ABCVersion):
+    """
+    Extract the abc version from the abc file header.
+
+    Parameters:
+    src (str): The abc file header.
+
+    Returns:
+    Tuple[str, ABCVersion]: A tuple containing the file header without the
+    version string and the ABC version.
+    """
     # The ABC version string if set is the first line of an ABC file.
     try:
         _, version, src = ABC_VERSION_SPLIT(src, maxsplit=1)
@@ -102,10 +225,446 @@ def split_abc_data(src: str) -> (str, list[str], ABCVersion):
         # no %%abc-.. Version found, use a default version ?
         version = DEFAULT_VERSION
 
-    return src, abc_tunes, version
+    return src, version
 
 
-def abc_translator(src: str | Path) -> stream.Stream:
+def iter_split_abc_data(src: str | TextIO) -> Iterator[str]:
+    """
+    Incrementally split ABC data into the abc file header and the individual
+    ABC tunes.
+
+    The sections are yielded in the same order as ABC_TUNE_BOOK_SPLIT returns
+    them: the file header, followed by the X: field and the source of each tune.
+    A text file is read line by line, so only a single tune is held in memory.
+
+    Parameters:
+    src (str | TextIO): The ABC data or a text file with ABC data.
+
+    Examples:
+
+    >>> list(iter_split_abc_data('C:Bach\\nX:1\\nK:\\nCEG\\nX:2\\nK:\\nEGB\\n'))
+    ['C:Bach\\n', 'X:1', '\\nK:\\nCEG\\n', 'X:2', '\\nK:\\nEGB\\n']
+    """
+    if isinstance(src, str):
+        start_pos = 0
+        for match in RE_X_FIELD.finditer(src):
+            yield src[start_pos:match.start()]
+            yield match.group()
+            start_pos = match.end()
+        yield src[start_pos:]
+        return
+
+    lines: list[str] = []
+    for line in src:
+        if line.startswith('X:'):
+            yield "".join(lines)
+            x_field = line.rstrip('\n')
+            yield x_field
+            lines = [line[len(x_field):]]
+        else:
+            lines.append(line)
+    yield "".join(lines)
+
+
+def translate_file_header(src: str, version: ABCVersion | None = None) -> \
+        (FileHeader, dict[str, str]):
+    """
+    Process the file header of a tune book.
+
+    Parameters:
+    - src: The abc source of the file header.
+    - version: The abc version of the tune book, without a version the abc
+      version string is extracted from the file header.
+
+    Returns: A tuple containing the processed file header and the macros
+    defined in the file header.
+    """
+    if version is None:
+        src, version = split_abc_version(src)
+    # Evaluate and apply macros on the file header
+    src, macros = apply_macros(src)
+    file_header = FileHeader(version)
+    file_header.src = src
+    file_header.process(tokenize(src, version))
+    return file_header, macros
+
+
+def translate_tune_header(src: str, abc_ref_number: str, file_header: FileHeader,
+                          macros: dict[str, str] | None = None) -> TuneHeader:
+    """
+    Process the tune header of a single tune of a tune book.
+
+    The tokenizer stops after the K: field, the tune body is neither tokenized
+    nor translated. The remaining tokens of the tune body are available from the
+    token generator of the returned tune header.
+
+    Parameters:
+    - src: The abc source of the tune (or just its header) without the leading X: field.
+    - abc_ref_number: The X: field of the tune.
+    - file_header: The processed file header of the tune book.
+    - macros: The macros defined in the file header.
+
+    Returns: The processed tune header.
+    """
+    # Evaluate and apply macros on the tune
+    src = apply_macros(src, macros)[0].lstrip('\n')
+    # HeaderParser will process tokens until the header ends with Field 'K:'
+    tune_header = TuneHeader(file_header=file_header, abc_version=file_header.abc_version)
+    tune_header.process(tokenize(src))
+    tune_header.metadata.number = abc_ref_number
+    return tune_header
+
+
+def translate_tune(src: str, abc_ref_number: str, file_header: FileHeader,
+                   macros: dict[str, str] | None = None, source: str = "string",
+                   cache: 'ScoreCache | None' = None) -> stream.Score:
+    """
+    Translate a single tune of a tune book into a music21 score.
+
+    Every tune starts with the state of the file header, the tunes of a tune
+    book do not share any state with each other.
+
+    Parameters:
+    - src: The abc source of the tune without the leading X: field.
+    - abc_ref_number: The X: field of the tune.
+    - file_header: The processed file header of the tune book.
+    - macros: The macros defined in the file header.
+    - source: The origin of the tune, "string" or the path of the abc file.
+    - cache: A :class:`~abc_to_music21.cache.ScoreCache` for translated tunes.
+
+    Returns: A music21 score with the translated tune.
+    """
+    score = None
+    if cache is not None:
+        cache_key = cache.key(src, abc_ref_number, file_header, macros)
+        score = cache.get(cache_key)
+
+    if score is None:
+        tune_header = translate_tune_header(src, abc_ref_number, file_header, macros)
+        # BodyParser will process all remaining tokens
+        score = TuneBody(tune_header=tune_header).process(tune_header.token_generator)
+        if cache is not None:
+            cache.put(cache_key, score)
+
+    score.id = score_id(abc_ref_number, source)
+    return score
+
+
+def score_id(abc_ref_number: str, source: str = "string") -> str:
+    """
+    Returns the id of the score of a tune, made of its X: field and its origin.
+
+    >>> score_id('X:1')
+    'X:1'
+    >>> score_id('X:1', 'tunes.abc')
+    "X:1 (file='tunes.abc')"
+    """
+    if source == "string":
+        return abc_ref_number
+    return f"{abc_ref_number} (file='{source}')"
+
+
+class _ScorePickler(pickle.Pickler):
+    # The sites of the elements are not pickled but rebuilt by thaw_score
+    def persistent_id(self, obj):
+        if isinstance(obj, sites.Sites):
+            return 'Sites'
+        return None
+
+
+class _ScoreUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        return sites.Sites()
+
+
+def freeze_score(score: stream.Stream) -> bytes:
+    """
+    Serialize a score to pass it to another process or to store it in a cache,
+    see :func:`~thaw_score`.
+    """
+    f = io.BytesIO()
+    _ScorePickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(score)
+    return f.getvalue()
+
+
+def thaw_score(data: bytes) -> stream.Stream:
+    """
+    Deserialize a score serialized by :func:`~freeze_score`.
+
+    A music21 stream keeps the offsets of its elements in a dictionary keyed by
+    the id() of the elements and an element keeps its sites keyed by the id()
+    of the streams. The ids of the unpickled objects differ from the pickled
+    ones, these dictionaries are rebuilt for all streams of the score
+    (including the spanner storages).
+
+    >>> score = thaw_score(freeze_score(abc_translator('X:1\\nK:G\\n"G"G2 .B>d|]')))
+    >>> [(n.offset, n.getContextByClass(key.Key).sharps) for n in score.flatten().notes]
+    [(0.0, 1), (0.0, 1), (1.0, 1), (1.75, 1)]
+    """
+    score = _ScoreUnpickler(io.BytesIO(data)).load()
+    pending = [score]
+    while pending:
+        s = pending.pop()
+        s._offsetDict = {id(e): (offset, e) for offset, e in s._offsetDict.values()}
+        s._cache = {}
+        for e in s._elements + s._endElements:
+            e.sites.add(s)
+            if e.isStream:
+                pending.append(e)
+            elif isinstance(e, spanner.Spanner):
+                pending.append(e.spannerStorage)
+    return score
+
+
+# The file header state of a worker process, set once by the pool initializer.
+_WORKER_FILE_HEADER: tuple[FileHeader, dict[str, str]] | None = None
+
+
+def _init_worker(file_header: FileHeader, macros: dict[str, str], config: dict):
+    global _WORKER_FILE_HEADER
+    _WORKER_FILE_HEADER = (file_header, macros)
+    # A spawned worker process does not inherit the configuration of the parent process
+    ABC2M21_CONFIG.update(config)
+
+
+def _translate_tune_worker(src: str, abc_ref_number: str, source: str) -> bytes:
+    file_header, macros = _WORKER_FILE_HEADER
+    return freeze_score(translate_tune(src, abc_ref_number, file_header, macros, source))
+
+
+def translate_tunes(tunes: list[tuple[str, str]], file_header: FileHeader,
+                    macros: dict[str, str] | None = None, source: str = "string",
+                    workers: int | None = None,
+                    cache: 'ScoreCache | None' = None) -> list[stream.Score]:
+    """
+    Translate the tunes of a tune book, optionally with a pool of worker processes.
+
+    The file header is processed once and passed to each worker process when
+    the pool starts. The largest tunes are scheduled first to keep the
+    workers busy until the end, the scores are returned in the order of the
+    tune book anyway.
+
+    Parameters:
+    - tunes: A list of (X: field, tune source) tuples.
+    - file_header: The processed file header of the tune book.
+    - macros: The macros defined in the file header.
+    - source: The origin of the tunes, "string" or the path of the abc file.
+    - workers: The number of worker processes, None or 1 for no worker process.
+    - cache: A :class:`~abc_to_music21.cache.ScoreCache` for translated tunes.
+      Only the tunes missing in the cache are translated.
+
+    Returns: A list of music21 scores in the order of the tunes.
+    """
+    macros = {} if macros is None else macros
+    scores: list[stream.Score | None] = [None] * len(tunes)
+
+    if cache is not None:
+        cache_keys = [cache.key(tune_src, abc_ref_number, file_header, macros)
+                      for abc_ref_number, tune_src in tunes]
+        scores = [cache.get(cache_key) for cache_key in cache_keys]
+
+    missing = [i for i, score in enumerate(scores) if score is None]
+    if workers is None or workers < 2 or len(missing) < 2:
+        for i in missing:
+            abc_ref_number, tune_src = tunes[i]
+            scores[i] = translate_tune(tune_src, abc_ref_number, file_header, macros, source)
+    else:
+        largest_first = sorted(missing, key=lambda i: len(tunes[i][1]), reverse=True)
+        with ProcessPoolExecutor(max_workers=min(workers, len(missing)),
+                                 initializer=_init_worker,
+                                 initargs=(file_header, macros, dict(ABC2M21_CONFIG))) as executor:
+            futures = {executor.submit(_translate_tune_worker, tunes[i][1], tunes[i][0], source): i
+                       for i in largest_first}
+            for future in as_completed(futures):
+                scores[futures[future]] = thaw_score(future.result())
+
+    if cache is not None:
+        for i in missing:
+            cache.put(cache_keys[i], scores[i])
+        for score, (abc_ref_number, _) in zip(scores, tunes):
+            score.id = score_id(abc_ref_number, source)
+
+    return scores
+
+
+def translate_tune_batch(tunes: Iterable[str], file_header: FileHeader | str,
+                         macros: dict[str, str] | None = None, workers: int | None = None,
+                         cache: 'ScoreCache | None' = None) -> list[stream.Score]:
+    """
+    Translate single tunes which share a common file header, but are not part
+    of a tune book, e.g. tunes stored one by one in a database.
+
+    The file header is processed only once, for each tune only the source of
+    the tune itself is tokenized and translated.
+
+    Parameters:
+    - tunes: The abc sources of the tunes. A tune may start with its X: field,
+      otherwise its position in the batch (starting with 1) is used as
+      reference number.
+    - file_header: The processed file header (see :func:`~translate_file_header`)
+      or the abc source of the file header.
+    - macros: The macros defined in the file header. The macros of a file
+      header source are taken from the file header source itself.
+    - workers: The number of worker processes, None or 1 for no worker process.
+    - cache: A :class:`~abc_to_music21.cache.ScoreCache` for translated tunes.
+      A processed file header must come from :func:`~translate_file_header`.
+
+    Returns: A list of music21 scores in the order of the tunes.
+
+    Examples:
+
+    >>> file_header, macros = translate_file_header('C:Trad.\\nm: ~G3 = G{A}G{F}G\\n')
+    >>> scores = translate_tune_batch(['X:7\\nT:tune 1\\nK:G\\n~G3', 'T:tune 2\\nK:D\\nDFA'],
+    ...                               file_header, macros)
+    >>> [(score.metadata.number, score.metadata.composer) for score in scores]
+    [('X:7', 'Trad.'), ('X:2', 'Trad.')]
+    """
+    if isinstance(file_header, str):
+        file_header, header_macros = translate_file_header(file_header)
+        macros = header_macros if macros is None else {**header_macros, **macros}
+
+    abc_tunes = []
+    for number, tune_src in enumerate(tunes, start=1):
+        tune_src = tune_src.lstrip()
+        if tune_src.startswith('X:'):
+            x_field, _, tune_src = tune_src.partition('\n')
+            abc_ref_number = x_field.split('%', maxsplit=1)[0].strip()
+        else:
+            abc_ref_number = f'X:{number}'
+        abc_tunes.append((abc_ref_number, tune_src))
+
+    return translate_tunes(abc_tunes, file_header, macros, workers=workers, cache=cache)
+
+
+def iter_abc_tunes(src: AbcSource) -> Iterator[tuple[str, stream.Score]]:
+    """
+    Translate the tunes of a tune book one at a time.
+
+    In contrast to :func:`~abc_translator` no opus is created, the tune book
+    is split incrementally and each tune is translated only when the next
+    score is requested. The file header is processed once and shared by all
+    tunes. A tune book file is read (and decompressed) line by line.
+
+    Parameters:
+    - src: The input ABC notation as a string, a path to an ABC file (gzip, bz2
+      or xz compressed or a zip archive of tune books) or a file object, see
+      :func:`~abc_to_music21.sources.iter_abc_books`.
+
+    Returns: An iterator of (reference number, score) tuples in the order of
+    the tune book. ABC data without a X: field yields nothing.
+
+    Examples:
+
+    >>> abc_tune_book = '''
+    ... X:1
+    ... T:tune 1
+    ... K:
+    ... EGB
+    ... X: 2
+    ... T:tune 2
+    ... K:
+    ... CEG'''
+    >>> for number, score in iter_abc_tunes(abc_tune_book):
+    ...     print(number, score.metadata.title)
+    1 tune 1
+    2 tune 2
+    """
+    for book, source in iter_abc_books(src):
+        yield from _iter_tunes(iter_split_abc_data(book), source)
+
+
+def _iter_tunes(sections: Iterator[str], source: str) -> Iterator[tuple[str, stream.Score]]:
+    file_header, file_header_macros = translate_file_header(next(sections))
+    for x_field in sections:
+        tune_src = next(sections, "")
+        abc_ref_number = x_field.split('%', maxsplit=1)[0].strip()
+        score = translate_tune(tune_src, abc_ref_number, file_header, file_header_macros, source)
+        yield abc_ref_number[2:].strip(), score
+
+
+class TuneHeaderInfo(NamedTuple):
+    """
+    The information of a tune header, as returned by :func:`~read_abc_headers`.
+
+    Attributes:
+        number (str): The reference number of the tune.
+        metadata (metadata.Metadata): The metadata (title, composer, ...) of the tune.
+        key_signature (key.KeySignature | None): The key of the tune.
+        time_signature (meter.TimeSignature | None): The meter of the tune.
+        tempo (tempo.MetronomeMark | None): The tempo of the tune.
+    """
+    number: str
+    metadata: metadata.Metadata
+    key_signature: key.KeySignature | None
+    time_signature: meter.TimeSignature | None
+    tempo: tempo.MetronomeMark | None
+
+
+def read_abc_headers(src: AbcSource) -> Iterator[TuneHeaderInfo]:
+    """
+    Read the tune headers of a tune book without translating the tune bodies.
+
+    Only the file header and the tune headers up to the K: field are tokenized
+    and processed, the tune bodies are skipped.
+
+    Parameters:
+    - src: The input ABC notation as a string, a path to an ABC file or a
+      file object, see :func:`~abc_to_music21.sources.iter_abc_books`.
+
+    Returns: An iterator of the tune header information in the order of the tune book.
+
+    Examples:
+
+    >>> abc_tune_book = '''
+    ... C:Trad.
+    ... X:1
+    ... T:tune 1
+    ... M:6/8
+    ... K:G
+    ... GAB
+    ... X: 2
+    ... T:tune 2
+    ... K:Dm
+    ... DFA'''
+    >>> for info in read_abc_headers(abc_tune_book):
+    ...     print(info.number, info.metadata.title, info.metadata.composer,
+    ...           info.key_signature, info.time_signature)
+    1 tune 1 Trad. G major <music21.meter.TimeSignature 6/8>
+    2 tune 2 Trad. d minor None
+    """
+    for book, _ in iter_abc_books(src):
+        yield from _iter_tune_headers(iter_split_abc_data(book))
+
+
+def _iter_tune_headers(sections: Iterator[str]) -> Iterator[TuneHeaderInfo]:
+    file_header, file_header_macros = translate_file_header(next(sections))
+    for x_field in sections:
+        tune_src = next(sections, "")
+        # Cut the tune body, the tune header ends with the first K: field
+        if match := RE_KEY_FIELD.search(tune_src):
+            tune_src = tune_src[:match.end()]
+        abc_ref_number = x_field.split('%', maxsplit=1)[0].strip()
+        tune_header = translate_tune_header(tune_src, abc_ref_number, file_header,
+                                            file_header_macros)
+        yield TuneHeaderInfo(number=abc_ref_number[2:].strip(), metadata=tune_header.metadata,
+                             key_signature=tune_header.key_signature,
+                             time_signature=tune_header.time_signature,
+                             tempo=tune_header.tempo)
+
+
+def _translate_tune_book(src: str, abc_tunes: list[str], version: ABCVersion, source: str,
+                         workers: int | None, cache: 'ScoreCache | None') -> list[stream.Score]:
+    if not abc_tunes:
+        return []
+    file_header, file_header_macros = translate_file_header(src, version)
+    tunes = [(x_field.split('%', maxsplit=1)[0].strip(), tune_src)
+             for x_field, tune_src in zip(abc_tunes[::2], abc_tunes[1::2])]
+    return translate_tunes(tunes, file_header, file_header_macros,
+                           source=source, workers=workers, cache=cache)
+
+
+def abc_translator(src: AbcSource, workers: int | None = None,
+                   cache: 'ScoreCache | None' = None) -> stream.Stream:
     """
     Translate ABC notation to a music21 stream.
 
@@ -115,7 +674,14 @@ def abc_translator(src: str | Path) -> stream.Stream:
     or just a stream.Measure.
 
     Parameters:
-    - abc: The input ABC notation as a string or a path to an ABC file.
+    - abc: The input ABC notation as a string, a path to an ABC file or a file
+      object. Compressed files (gzip, bz2, xz) are decompressed, the tunes of all
+      tune books of a zip archive are collected in a single opus.
+    - workers: The number of worker processes used to translate the tunes
+      of a tune book. Without workers (or a single worker) the tunes are
+      translated one after the other in this process.
+    - cache: A :class:`~abc_to_music21.cache.ScoreCache`, the tunes of a tune
+      book found in the cache are not translated again.
 
     Returns: A music21 stream object representing the parsed ABC content.
 
@@ -183,52 +749,29 @@ def abc_translator(src: str | Path) -> stream.Stream:
     ... !>(!ABCD!>)!'''
     >>> isinstance(abc_translator(abc_fragment), stream.Part)
     True
+
+    The tunes of a large tune book may be translated in parallel by a pool
+    of worker processes. The scores of the opus keep the order of the tune book.
+
+    >>> opus = abc_translator(abc_tune_book, workers=2)
+    >>> [score.metadata.title for score in opus.scores]
+    ['tune 1', 'tune 2']
     """
-    if isinstance(src, str):
-        source_type = "string"
-    elif isinstance(src, Path):
+    books = [(book if isinstance(book, str) else book.read(), source)
+             for book, source in iter_abc_books(src)]
+    if len(books) != 1:
+        # A zip archive with none or several tune books
         source_type = f"{src}"
-        with src.open() as f:
-            src = f.read()
+        scores = [score for book, source in books
+                  for score in _translate_tune_book(*split_abc_data(book), source, workers, cache)]
+        if not scores:
+            raise ABCException(f"No abc tunes found in '{source_type}'")
     else:
-        raise ABCException("Illegal abc input, chose a pathlib.Path or str")
-
-    src, abc_tunes, version = split_abc_data(src)
-    if abc_tunes:
-        # Evaluate and apply macros on the file header
-        src, file_header_macros = apply_macros(src)
-        parser = FileHeader(version)
-        parser.process(tokenize(src, version))
-
-        scores = []
-        abc_tunes = iter(abc_tunes)
-        while True:
-            try:
-                abc_ref_number = next(abc_tunes).split('%', maxsplit=1)[0].strip()
-                src = next(abc_tunes, "")
-            except StopIteration:
-                break
-
-            # Evaluate and apply macros on the tunes
-            src = apply_macros(src, file_header_macros)[0].lstrip('\n')
-            tokens = tokenize(src)
-            # tokens = list(tokens)
-            # HeaderParser will process tokens until the header ends with Field 'K:'
-            parser = TuneHeader(file_header=parser, abc_version=version)
-            parser.process(tokens)
-            # tokens = list(tokens)
-            # BodyParser will process all remaining tokens
-            score = TuneBody(tune_header=parser).process(tokens)
-            # if score.metadata:
-            score.metadata.number = abc_ref_number
-
-            if source_type == "string":
-                score.id = abc_ref_number
-            else:
-                score.id = f"{abc_ref_number} (file='{source_type}')"
-
-            scores.append(score)
+        src, source_type = books[0]
+        src, abc_tunes, version = split_abc_data(src)
+        scores = _translate_tune_book(src, abc_tunes, version, source_type, workers, cache)
 
+    if scores:
         if len(scores) > 1:
             opus = stream.Opus(id=source_type)
             opus.append(scores)
@@ -236,19 +779,42 @@ def abc_translator(src: str | Path) -> stream.Stream:
         return scores[0]
 
     # no, it is not a tune book just an abc fragment
+    return translate_fragment(src, version)
+
+
+def translate_fragment(src: str, version: ABCVersion = DEFAULT_VERSION) -> stream.Stream:
+    """
+    Translate an abc fragment without a tune header (and without a X: field).
+
+    A fragment of a single voice is translated directly into a music21 part
+    without building a score first, a part with a single measure is unwrapped
+    to the measure. Other fragments are translated into a score.
+
+    Parameters:
+    - src: The abc fragment.
+    - version: The abc version of the fragment.
+
+    Returns: A music21 measure, part or score.
+
+    >>> isinstance(translate_fragment('ABCD | EFGA'), stream.Part)
+    True
+    >>> translate_fragment('ABCD')
+    <music21.stream.Measure 0 offset=0.0>
+    """
     src = src.strip('\n') + '\n'
 
     parser = TuneHeader(abc_version=version)
     tokens = tokenize(src, abc_version=version)
-    #tokens = list(tokens)
-    m21_stream = TuneBody(tune_header=parser).process(tokens)
-    if len(m21_stream.parts) == 1:
+    m21_stream = TuneBody(tune_header=parser).process_fragment(tokens)
+    if isinstance(m21_stream, stream.Score):
+        if len(m21_stream.parts) != 1:
+            return m21_stream
         m21_stream = m21_stream.parts[0]
-        if len(m21_stream.elements) == 1:
-            measures = list(m21_stream.getElementsByClass(stream.Measure))
-            if len(measures) == 1:
-                return measures[0]
-        return m21_stream
+
+    if len(m21_stream.elements) == 1:
+        measures = list(m21_stream.getElementsByClass(stream.Measure))
+        if len(measures) == 1:
+            return measures[0]
     return m21_stream
 
 
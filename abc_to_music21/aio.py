@@ -0,0 +1,188 @@
+# -------------------------------------------------------------------------------
+# Name:         abc_to_music21/aio.py
+# Purpose:      asyncio interface of the abc translator.
+#
+# Authors:      Marian Schulz
+#
+# Copyslack:    Copyright © 2023, Marian Schulz
+# License:      SSL - SUBGENIUS SOFTWARE LICENSE
+# -------------------------------------------------------------------------------
+"""
+The translation of abc notation is CPU-bound and would block an asyncio event
+loop for the whole translation. The coroutines in this module offload the
+translation to an executor, tune by tune. A task awaiting the translation can
+be cancelled between two tunes, and the number of tunes of a tune book
+translated at the same time is limited.
+
+The executor may be a thread pool or a process pool. The scores translated in
+a worker process are passed back with :func:`~abc_to_music21.freeze_score`.
+
+>>> import asyncio
+>>> abc_tune_book = '''
+... X:1
+... T:tune 1
+... K:
+... EGB
+... X: 2
+... T:tune 2
+... K:
+... CEG'''
+>>> async def titles():
+...     return [score.metadata.title async for _, score in aiter_abc_tunes(abc_tune_book)]
+>>> asyncio.run(titles())
+['tune 1', 'tune 2']
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from copy import deepcopy
+from functools import partial
+from typing import AsyncIterator, Callable, NamedTuple
+from music21 import stream
+from abc_to_music21 import abc_translator, split_abc_data, translate_file_header, translate_tune
+from abc_to_music21 import freeze_score, thaw_score
+from abc_to_music21.parser import ABC2M21_CONFIG, ABCException, FileHeader
+from abc_to_music21.sources import AbcSource, iter_abc_books
+
+
+class TuneBook(NamedTuple):
+    """
+    A tune book, split into its tunes, with the processed file header.
+    """
+    source: str
+    file_header: FileHeader
+    macros: dict[str, str]
+    tunes: list[tuple[str, str]]
+
+
+def read_tune_book(src: AbcSource) -> TuneBook | str:
+    """
+    Read and split a tune book and process its file header.
+
+    Returns: The tune book, or the abc data read if it is not a tune book but
+    an abc fragment. A file object can't be read again.
+    """
+    books = [(book if isinstance(book, str) else book.read(), source)
+             for book, source in iter_abc_books(src)]
+    if len(books) != 1:
+        raise ABCException(f"Expected a single tune book in '{src}', found {len(books)}")
+    src, source = books[0]
+
+    header_src, abc_tunes, version = split_abc_data(src)
+    if not abc_tunes:
+        return src
+
+    file_header, macros = translate_file_header(header_src, version)
+    tunes = [(x_field.split('%', maxsplit=1)[0].strip(), tune_src)
+             for x_field, tune_src in zip(abc_tunes[::2], abc_tunes[1::2])]
+    return TuneBook(source=source, file_header=file_header, macros=macros, tunes=tunes)
+
+
+def _translate_frozen(config: dict, translate: Callable[..., stream.Stream], *args) -> bytes:
+    # Runs in a worker process, which does not share the configuration of the
+    # parent process. Plain pickling would break the streams of the score.
+    ABC2M21_CONFIG.update(config)
+    return freeze_score(translate(*args))
+
+
+async def _run_translation(executor: Executor | None, translate: Callable[..., stream.Stream],
+                           *args) -> stream.Stream:
+    # Run a translation in the executor, through freeze_score and thaw_score
+    # for a process pool
+    loop = asyncio.get_running_loop()
+    if isinstance(executor, ProcessPoolExecutor):
+        return thaw_score(await loop.run_in_executor(
+            executor, partial(_translate_frozen, dict(ABC2M21_CONFIG), translate, *args)))
+    return await loop.run_in_executor(executor, partial(translate, *args))
+
+
+async def aiter_abc_tunes(src: AbcSource, executor: Executor | None = None,
+                          concurrency: int = 1) -> AsyncIterator[tuple[str, stream.Score]]:
+    """
+    Translate the tunes of a tune book in an executor, one (reference number,
+    score) tuple is yielded for each tune in the order of the tune book.
+
+    Args:
+        src (AbcSource): The input ABC notation as a string, a path to an ABC file or a
+        file object, see :func:`~abc_to_music21.sources.iter_abc_books`.
+        executor (Executor | None): The executor for the translation, the
+        default executor of the event loop if None.
+        concurrency (int): The maximum number of tunes translated at the same time.
+
+    Closing the iterator or cancelling the task cancels the tunes whose
+    translation has not started yet.
+    """
+    loop = asyncio.get_running_loop()
+    tune_book = await loop.run_in_executor(executor, read_tune_book, src)
+    if isinstance(tune_book, str):
+        return
+
+    async for abc_ref_number, score in _translate_tune_book(tune_book, executor, concurrency):
+        yield abc_ref_number[2:].strip(), score
+
+
+async def _translate_tune_book(tune_book: TuneBook, executor: Executor | None,
+                               concurrency: int) -> AsyncIterator[tuple[str, stream.Score]]:
+    pending: deque[tuple[str, asyncio.Future]] = deque()
+    tunes = iter(tune_book.tunes)
+    try:
+        while True:
+            # Keep up to 'concurrency' tunes in the executor. The time signature
+            # of the file header is added to the score of a tune, each tune gets
+            # a copy of the file header.
+            for abc_ref_number, tune_src in tunes:
+                pending.append((abc_ref_number, asyncio.ensure_future(_run_translation(
+                    executor, translate_tune, tune_src, abc_ref_number,
+                    deepcopy(tune_book.file_header), tune_book.macros, tune_book.source))))
+                if len(pending) >= max(1, concurrency):
+                    break
+
+            if not pending:
+                return
+
+            abc_ref_number, future = pending.popleft()
+            yield abc_ref_number, await future
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+async def abc_translate_async(src: AbcSource, executor: Executor | None = None,
+                              concurrency: int = 1) -> stream.Stream:
+    """
+    Translate ABC notation to a music21 stream like :func:`~abc_to_music21.abc_translator`,
+    but in an executor, without blocking the event loop.
+
+    Args:
+        src (AbcSource): The input ABC notation as a string, a path to an ABC file or a
+        file object, see :func:`~abc_to_music21.sources.iter_abc_books`.
+        executor (Executor | None): The executor for the translation, the
+        default executor of the event loop if None.
+        concurrency (int): The maximum number of tunes translated at the same time.
+
+    Examples:
+
+    >>> asyncio.run(abc_translate_async('X:1\\nT:single tune\\nK:\\nCEG'))
+    <music21.stream.Score X:1>
+    >>> isinstance(asyncio.run(abc_translate_async('ABCD | EFGA')), stream.Part)
+    True
+    """
+    loop = asyncio.get_running_loop()
+    tune_book = await loop.run_in_executor(executor, read_tune_book, src)
+    if isinstance(tune_book, str):
+        # An abc fragment, there are no tunes to translate one after another
+        return await _run_translation(executor, abc_translator, tune_book)
+
+    scores = [score async for _, score in _translate_tune_book(tune_book, executor, concurrency)]
+    if len(scores) > 1:
+        opus = stream.Opus(id=tune_book.source)
+        opus.append(scores)
+        return opus
+    return scores[0]
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod(optionflags=doctest.NORMALIZE_WHITESPACE)
@@ -0,0 +1,88 @@
+# -------------------------------------------------------------------------------
+# Name:         abc_to_music21/benchmark.py
+# Purpose:      Benchmarks of the abc tokenizer.
+#
+# Authors:      Marian Schulz
+#
+# Copyslack:    Copyright © 2023, Marian Schulz
+# License:      SSL - SUBGENIUS SOFTWARE LICENSE
+# -------------------------------------------------------------------------------
+"""
+Measure the throughput of the tokenizer (tokens per second) on abc files.
+
+Run the benchmarks with the abc files of this repository or with other files::
+
+    python -m abc_to_music21.benchmark
+    python -m abc_to_music21.benchmark tunes.abc
+
+Each scanner is run several times, the best run is reported.
+"""
+
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Iterable, NamedTuple
+from abc_to_music21.tokens import TOKEN_RE, scan_tokens, tokenize, tokenize_table
+
+ABC_DIR = Path(__file__).parent.parent / 'abc'
+DEFAULT_FILES = [ABC_DIR / 'bwv1052a.abc', ABC_DIR / 'Wtcii01a.abc']
+
+# The scanners to compare, each returns the number of tokens of an abc source
+SCANNERS: dict[str, Callable[[str], int]] = {
+    'TOKEN_RE.finditer': lambda src: sum(1 for _ in TOKEN_RE.finditer(src)),
+    'scan_tokens': lambda src: sum(1 for _ in scan_tokens(src)),
+    'tokenize': lambda src: sum(1 for _ in tokenize(src)),
+    'tokenize_table': lambda src: len(tokenize_table(src)),
+}
+
+
+class BenchmarkResult(NamedTuple):
+    """
+    The result of a scanner on an abc source.
+
+    Attributes:
+        scanner (str): The name of the scanner.
+        tokens (int): The number of tokens found.
+        seconds (float): The time of the best run.
+    """
+    scanner: str
+    tokens: int
+    seconds: float
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.seconds
+
+
+def benchmark(src: str, repeat: int = 5) -> list[BenchmarkResult]:
+    """
+    Run all scanners on the abc source.
+
+    >>> [r.scanner for r in benchmark('X:1\\nK:G\\nGAB', repeat=1)]
+    ['TOKEN_RE.finditer', 'scan_tokens', 'tokenize', 'tokenize_table']
+    """
+    results = []
+    for name, scanner in SCANNERS.items():
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            tokens = scanner(src)
+            best = min(best, time.perf_counter() - start)
+        results.append(BenchmarkResult(name, tokens, best))
+    return results
+
+
+def main(paths: Iterable[Path]):
+    for path in paths:
+        src = path.read_text()
+        results = benchmark(src)
+        baseline = results[0].seconds
+        print(f"{path.name} ({len(src)} characters)")
+        for result in results:
+            print(f"  {result.scanner:<20} {result.tokens:>8} tokens "
+                  f"{result.tokens_per_second:>12,.0f} tokens/s "
+                  f"{baseline / result.seconds:>6.2f}x")
+
+
+if __name__ == '__main__':
+    main([Path(p) for p in sys.argv[1:]] or DEFAULT_FILES)
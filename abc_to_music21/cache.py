@@ -0,0 +1,432 @@
+# -------------------------------------------------------------------------------
+# Name:         abc_to_music21/cache.py
+# Purpose:      Caches for translated abc tunes.
+#
+# Authors:      Marian Schulz
+#
+# Copyslack:    Copyright © 2023, Marian Schulz
+# License:      SSL - SUBGENIUS SOFTWARE LICENSE
+# -------------------------------------------------------------------------------
+"""
+The translation of a tune into a music21 score is expensive, but the result
+only depends on the source of the tune, the file header of the tune book, the
+abc version and the configuration (ABC2M21_CONFIG). A cache stores translated
+scores under a hash of this input, so an unchanged tune is never translated
+again.
+
+The :class:`~MemoryScoreCache` keeps the most recently used scores in the
+memory of the process. The :class:`~ScoreCache` stores the pickled scores in
+a directory on the disk. A cache is passed to
+:func:`~abc_to_music21.abc_translator` or :func:`~abc_to_music21.translate_tune`:
+
+>>> from tempfile import TemporaryDirectory
+>>> from abc_to_music21 import abc_translator
+>>> abc_tune_book = '''
+... X:1
+... T:tune 1
+... K:
+... EGB
+... X: 2
+... T:tune 2
+... K:
+... CEG'''
+>>> with TemporaryDirectory() as cache_dir:
+...     cache = ScoreCache(cache_dir)
+...     opus = abc_translator(abc_tune_book, cache=cache)
+...     opus = abc_translator(abc_tune_book, cache=cache)
+...     cache.hits, cache.misses
+(2, 2)
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple
+import music21
+from music21 import stream
+from abc_to_music21 import freeze_score, split_abc_data, thaw_score, translate_file_header
+from abc_to_music21 import translate_tunes
+from abc_to_music21.parser import ABC2M21_CONFIG, ABCException, FileHeader
+
+
+def normalize_abc(src: str) -> str:
+    """
+    Normalize the line endings and remove trailing whitespaces of each line,
+    which do not change the translation of a tune.
+
+    >>> normalize_abc('K:G  \\r\\nGAB\\t\\n')
+    'K:G\\nGAB\\n'
+    """
+    return '\n'.join(line.rstrip() for line in src.replace('\r\n', '\n').split('\n'))
+
+
+def tune_key(src: str, abc_ref_number: str, file_header: FileHeader,
+             macros: dict[str, str] | None = None) -> str:
+    """
+    Returns the cache key of a tune, a hash of everything the translation of
+    the tune depends on.
+
+    Args:
+        src (str): The abc source of the tune without the leading X: field.
+        abc_ref_number (str): The X: field of the tune.
+        file_header (FileHeader): The processed file header of the tune book.
+        macros (dict[str, str] | None): The macros applied on the tune. The
+        macro definitions are removed from the source of the file header,
+        they are hashed separately.
+
+    Raises:
+        ABCException: If the file header was not processed by
+        :func:`~abc_to_music21.translate_file_header`, the state of such a
+        file header is not identified by its abc source.
+    """
+    if file_header.src is None:
+        raise ABCException("Can't cache tunes of a file header without abc source, "
+                           "process the file header with translate_file_header.")
+
+    content_hash = hashlib.sha256()
+    for part in (music21.VERSION_STR, repr(file_header.abc_version),
+                 json.dumps(ABC2M21_CONFIG, sort_keys=True), normalize_abc(file_header.src),
+                 # The macros are expanded in the order of their definitions
+                 json.dumps(list((macros or {}).items())), abc_ref_number, normalize_abc(src)):
+        content_hash.update(part.encode('utf-8'))
+        # Separate the parts, ('ab', 'c') must not have the same key as ('a', 'bc')
+        content_hash.update(b'\0')
+    return content_hash.hexdigest()
+
+
+class ScoreCache:
+    """
+    A content-addressed cache of translated scores in a directory on the disk.
+
+    Each score is pickled into a file named by its key. The total size of the
+    files is limited, the least recently used scores are evicted first. A
+    cache hit updates the modification time of the file, which is used as
+    the time of the last use.
+
+    Args:
+        directory (Path | str): The directory for the cache files.
+        max_size (int): The maximum total size of the cache files in bytes.
+
+    Attributes:
+        hits (int): The number of scores found in the cache.
+        misses (int): The number of scores not found in the cache.
+    """
+
+    SUFFIX = '.pickle'
+
+    def __init__(self, directory: Path | str, max_size: int = 512 * 1024 * 1024):
+        self.directory: Path = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size: int = max_size
+        self.hits: int = 0
+        self.misses: int = 0
+        self.size: int = sum(path.stat().st_size for path in self._files())
+
+    def _files(self) -> list[Path]:
+        return list(self.directory.glob(f'*{ScoreCache.SUFFIX}'))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f'{key}{ScoreCache.SUFFIX}'
+
+    @staticmethod
+    def key(src: str, abc_ref_number: str, file_header: FileHeader,
+            macros: dict[str, str] | None = None) -> str:
+        """
+        Returns the cache key of a tune, see :func:`~tune_key`.
+        """
+        return tune_key(src, abc_ref_number, file_header, macros)
+
+    def get(self, key: str) -> stream.Score | None:
+        """
+        Returns the cached score for the key or None.
+        """
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            # Mark the score as recently used
+            os.utime(path)
+            score = thaw_score(data)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return score
+
+    def put(self, key: str, score: stream.Score):
+        """
+        Store a score in the cache and evict the least recently used scores
+        if the cache exceeds its maximum size.
+        """
+        path = self._path(key)
+        data = freeze_score(score)
+        try:
+            # The score replaces the file of a score stored before
+            replaced_size = path.stat().st_size
+        except OSError:
+            replaced_size = 0
+        # Write into a temporary file first, another process must never read
+        # a partially written score.
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        self.size += len(data) - replaced_size
+
+        if self.size > self.max_size:
+            self.evict()
+
+    def discard(self, key: str):
+        """
+        Remove the score for the key from the cache, if present.
+        """
+        path = self._path(key)
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except OSError:
+            return
+        self.size -= size
+
+    def evict(self):
+        """
+        Remove the least recently used scores until the cache does not exceed
+        its maximum size.
+        """
+        files = []
+        for path in self._files():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, path))
+
+        files.sort()
+        self.size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            self.size -= size
+
+    def clear(self):
+        """
+        Remove all scores from the cache and reset the hit and miss counters.
+        """
+        for path in self._files():
+            path.unlink(missing_ok=True)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+
+class CacheInfo(NamedTuple):
+    """
+    Statistics of a :class:`~MemoryScoreCache`.
+    """
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class MemoryScoreCache:
+    """
+    A bounded in-process LRU cache of translated scores.
+
+    The scores are stored pickled, each cache hit returns a new copy of the
+    score, so a caller can never corrupt the cached score. Unpickling a score
+    is much cheaper than a deepcopy, let alone a new translation. The cache has
+    the same interface as the :class:`~ScoreCache` and is safe to use from
+    multiple threads.
+
+    Args:
+        maxsize (int): The maximum number of scores in the cache.
+
+    Examples:
+
+    >>> from abc_to_music21 import abc_translator
+    >>> cache = MemoryScoreCache(maxsize=1)
+    >>> score = abc_translator('X:1\\nK:\\nCEG', cache=cache)
+    >>> score = abc_translator('X:1\\nK:\\nCEG', cache=cache)
+    >>> score = abc_translator('X:1\\nK:\\nEGB', cache=cache)
+    >>> cache.info()
+    CacheInfo(hits=1, misses=2, maxsize=1, currsize=1)
+    >>> cache.resize(0)
+    >>> cache.info()
+    CacheInfo(hits=1, misses=2, maxsize=0, currsize=0)
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize: int = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        self._scores: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._scores
+
+    @staticmethod
+    def key(src: str, abc_ref_number: str, file_header: FileHeader,
+            macros: dict[str, str] | None = None) -> str:
+        """
+        Returns the cache key of a tune, see :func:`~tune_key`.
+        """
+        return tune_key(src, abc_ref_number, file_header, macros)
+
+    def get(self, key: str) -> stream.Score | None:
+        """
+        Returns a copy of the cached score for the key or None.
+        """
+        with self._lock:
+            data = self._scores.get(key, None)
+            if data is None:
+                self.misses += 1
+                return None
+            self._scores.move_to_end(key)
+            self.hits += 1
+        return thaw_score(data)
+
+    def put(self, key: str, score: stream.Score):
+        """
+        Store a score in the cache and evict the least recently used score
+        if the cache is full.
+        """
+        data = freeze_score(score)
+        with self._lock:
+            self._scores[key] = data
+            self._scores.move_to_end(key)
+            self._evict()
+
+    def discard(self, key: str):
+        """
+        Remove the score for the key from the cache, if present.
+        """
+        with self._lock:
+            self._scores.pop(key, None)
+
+    def _evict(self):
+        while len(self._scores) > self.maxsize:
+            self._scores.popitem(last=False)
+
+    def info(self) -> CacheInfo:
+        """
+        Returns the hits, misses, maximum and current size of the cache.
+        """
+        return CacheInfo(hits=self.hits, misses=self.misses, maxsize=self.maxsize,
+                         currsize=len(self._scores))
+
+    def resize(self, maxsize: int):
+        """
+        Change the maximum number of scores, the least recently used scores are
+        evicted if the cache is too large.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        """
+        Remove all scores from the cache and reset the hit and miss counters.
+        """
+        with self._lock:
+            self._scores.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# A shared in-process cache, pass it to abc_translator(src, cache=TUNE_CACHE)
+TUNE_CACHE = MemoryScoreCache()
+
+
+class IncrementalResult(NamedTuple):
+    """
+    The result of :func:`~translate_incremental`.
+
+    Attributes:
+        scores (list[stream.Score]): The scores of all tunes in the order of the tune book.
+        changed (list[str]): The X: fields of the tunes that are new or have
+        changed since the last run.
+    """
+    scores: list[stream.Score]
+    changed: list[str]
+
+
+def translate_incremental(src: Path, manifest_path: Path,
+                          cache: ScoreCache | MemoryScoreCache,
+                          workers: int | None = None) -> IncrementalResult:
+    """
+    Translate a tune book again after it has been modified, only the tunes
+    that have changed since the last run are translated.
+
+    The manifest, a JSON file, records the cache keys of the tunes of the last
+    run. A tune whose cache key is not in the manifest has changed. The cache
+    key includes the file header, so a change of the file header (macros,
+    instructions, user-defined symbols, ...) changes every tune. The scores of
+    the unchanged tunes are taken from the cache, the scores of the tunes that
+    are no longer in the tune book are removed from the cache.
+
+    Args:
+        src (Path): The path of the abc tune book file.
+        manifest_path (Path): The path of the manifest file.
+        cache (ScoreCache | MemoryScoreCache): The cache with the scores of the last run.
+        workers (int | None): The number of worker processes for the changed tunes.
+
+    Examples:
+
+    >>> from tempfile import TemporaryDirectory
+    >>> with TemporaryDirectory() as tmp_dir:
+    ...     tune_book = Path(tmp_dir) / 'tunes.abc'
+    ...     _ = tune_book.write_text('X:1\\nK:\\nCEG\\nX:2\\nK:\\nEGB\\n')
+    ...     cache = ScoreCache(Path(tmp_dir) / 'cache')
+    ...     manifest = Path(tmp_dir) / 'manifest.json'
+    ...     translate_incremental(tune_book, manifest, cache).changed
+    ...     _ = tune_book.write_text('X:1\\nK:\\nCEG\\nX:2\\nK:\\nGBd\\n')
+    ...     translate_incremental(tune_book, manifest, cache).changed
+    ...     _ = tune_book.write_text('L:1/4\\nX:1\\nK:\\nCEG\\nX:2\\nK:\\nGBd\\n')
+    ...     translate_incremental(tune_book, manifest, cache).changed
+    ['X:1', 'X:2']
+    ['X:2']
+    ['X:1', 'X:2']
+    """
+    with src.open() as f:
+        header_src, abc_tunes, version = split_abc_data(f.read())
+    if not abc_tunes:
+        raise ABCException(f"'{src}' is not a tune book, there are no X: fields.")
+
+    file_header, macros = translate_file_header(header_src, version)
+    tunes = [(x_field.split('%', maxsplit=1)[0].strip(), tune_src)
+             for x_field, tune_src in zip(abc_tunes[::2], abc_tunes[1::2])]
+    keys = [cache.key(tune_src, abc_ref_number, file_header, macros)
+            for abc_ref_number, tune_src in tunes]
+
+    try:
+        previous_keys = set(json.loads(manifest_path.read_text())['tunes'])
+    except (OSError, ValueError, KeyError, TypeError):
+        # No (valid) manifest, this is the first run
+        previous_keys = set()
+
+    changed = [abc_ref_number for (abc_ref_number, _), key in zip(tunes, keys)
+               if key not in previous_keys]
+    scores = translate_tunes(tunes, file_header, macros, source=f"{src}",
+                             workers=workers, cache=cache)
+
+    # Forget the scores of the tunes removed or changed since the last run
+    for key in previous_keys.difference(keys):
+        cache.discard(key)
+
+    manifest_path.write_text(json.dumps({'source': f"{src}", 'tunes': keys}, indent=1))
+    return IncrementalResult(scores=scores, changed=changed)
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod(optionflags=doctest.NORMALIZE_WHITESPACE)
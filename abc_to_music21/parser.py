@@ -9,10 +9,12 @@
 # License:      SSL - SUBGENIUS SOFTWARE LICENSE
 #-------------------------------------------------------------------------------
 import copy
+import pickle
 import re
 from copy import deepcopy
 from fractions import Fraction
-from typing import Iterator, NamedTuple, TypeAlias
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, NamedTuple, TypeAlias
 from abc import abstractmethod
 import music21
 from music21 import duration, spanner, dynamics, common, tie, instrument, clef
@@ -20,6 +22,8 @@ from music21 import expressions, articulations, harmony, style, environment
 from music21 import key, pitch, stream, metadata, bar, tempo, layout
 from music21 import note, chord, repeat, meter
 from abc_to_music21.tokens import DEFAULT_VERSION, ABCVersion, Field, Token, tokenize
+from abc_to_music21.tokens import TOKEN_TYPE_NAMES, ChordToken, GraceToken, NoteToken
+from abc_to_music21.tokens import decode_length, decode_note, tokenize_cached
 
 ABC2M21_ENVIRONMENT = environment.Environment('abc_to_music21')
 ABC2M21_CONFIG = {'simplifiedComplexMeter': False}
@@ -45,7 +49,6 @@ ABC_VOICE_RE = re.compile(
     r'|(?P<stem>(stem)\s*=\s*(".*?"|\S+)(?!\S))')
 
 ABC_RE_TEMPO = re.compile(r'\s*("[^"]*")?\s*([0-9/ C]+\s*=\s*[0-9]+|[0-9]+)?\s*("[^"]*")?')
-ABC_RE_ABC_NOTE = re.compile(r'([\^_=]*)([A-Ga-g])([\',]*)([0-9/]*)([\-]*)')
 
 ABC_RE_voices = re.compile(r'[/(/)]|\d+|[A-Z]')
 
@@ -221,6 +224,26 @@ def join_voices(voices: list[stream.Part]) -> stream.Part:
     return new_part
 
 
+@lru_cache(maxsize=None)
+def _pickled_key(tonic: str, mode: str) -> bytes:
+    return pickle.dumps(key.Key(tonic, mode), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def new_key(tonic: str, mode: str) -> key.Key:
+    """
+    Returns a new music21 key.
+
+    Building the interval network of the scale of a key takes most of the
+    time of a small tune, a new key is unpickled from a cached key instead.
+
+    >>> new_key('G', 'mixolydian')
+    <music21.key.Key of G mixolydian>
+    >>> new_key('C', 'major') is new_key('C', 'major')
+    False
+    """
+    return pickle.loads(_pickled_key(tonic, mode))
+
+
 def fix_measures(score: stream.Score):
     """
     Apply the same bar lines and meter to all synchronized measures of the
@@ -285,8 +308,27 @@ def fix_measures(score: stream.Score):
 class ABCParser(ABCObject):
     """
     Base class for token processors implements the abc_token method.
+
+    The abc_token method dispatches a token to the abc method of its type
+    (abc_<token type>) with a table of the abc methods indexed by the type code
+    of the token. Each parser class builds its table at the first token.
     """
 
+    # The abc methods of this class indexed by the token type code
+    abc_methods: list[Callable | None] = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.abc_methods = []
+
+    @classmethod
+    def build_abc_methods(cls) -> list[Callable | None]:
+        """
+        Build the table of the abc methods for all token types interned so far.
+        """
+        cls.abc_methods = [getattr(cls, f'abc_{name}', None) for name in TOKEN_TYPE_NAMES]
+        return cls.abc_methods
+
     def __init__(self, abc_version: ABCVersion = DEFAULT_VERSION):
         """
         Initialize a new ABC Processor.
@@ -300,11 +342,16 @@ class ABCParser(ABCObject):
         # If a token is returned while processing the current token the token
         # is not necessarily the same token.
 
-        abc_method = getattr(self, f'abc_{token.type}', None)
+        try:
+            abc_method = self.abc_methods[token.code]
+        except IndexError:
+            # The table was built before the token type was interned
+            abc_method = self.build_abc_methods()[token.code]
+
         if abc_method is None:
             self.abc_debug(f"No abc_method 'abc_{token.type}'.", token)
         else:
-            return abc_method(token)
+            return abc_method(self, token)
 
 
 class FileHeader(ABCParser):
@@ -321,6 +368,10 @@ class FileHeader(ABCParser):
 
     def __init__(self, abc_version: ABCVersion = DEFAULT_VERSION):
         super().__init__(abc_version)
+        # The abc source of the file header (after applying macros), it
+        # identifies the file header state for a cache of translated tunes.
+        # None for a file header not processed by translate_file_header.
+        self.src: str | None = None
         self.metadata: metadata.Metadata = metadata.Metadata()
         self.quarter_length: float | None = None
         self.time_signature: meter.TimeSignature | None = None
@@ -552,7 +603,7 @@ class FileHeader(ABCParser):
                 self.abc_debug(f"User defined symbol {symbol} is not in [H-Wh-w~]", token)
                 return
 
-            self.user_defined[symbol] = list(tokenize(token_str))
+            self.user_defined[symbol] = list(tokenize_cached(token_str))
         except IndexError as e:
             self.abc_debug("Error while parsing definition of an user-defined symbol", token, e)
 
@@ -1443,7 +1494,7 @@ class TuneHeader(FileHeader):
             mode = ABC_MODES.get(_mode[:3], None)
             if mode:
                 tonic = key.convertKeyStringToMusic21KeyString(match['tonic'])
-                ks = key.Key(tonic, mode)
+                ks = new_key(tonic, mode)
                 if match['accidentals']:
                     # create a mapping between pitch class name (step) and accidental
                     altered_pitches = {p.step: p.accidental.modifier for p in ks.alteredPitches}
@@ -2088,22 +2139,22 @@ class NoteMixin:
          Returns:
              note.Note: A music21 Note object representing the parsed note.
          """
-        if not (match := ABC_RE_ABC_NOTE.match(token.src)):
+        # The note components are decoded by the tokenizer
+        components = token.components if isinstance(token, NoteToken) else decode_note(token.src)
+        if components is None:
             # Check the regular expression; this shouldn't happen.
             raise ABCException(f"String '{token.src}' is not an ABC note.")
 
         # ABC pitches are case-sensitive, indicating an octave.
-        pitch_name = match.group(2)
+        pitch_name = components.step
 
-        octave: int = (5 if pitch_name.islower() else 4)
-        if m := match.group(3):
-            octave = octave - m.count(',') + m.count("'")
+        octave: int = (5 if pitch_name.islower() else 4) + components.octave
         octave += self.octave if self.voice.octave is None else self.voice.octave
 
         pitch_name = pitch_name.upper()
 
         # the abc accidental of the note
-        accidental = self.abc_accidental(match.group(1))
+        accidental = self.abc_accidental(components.accidental)
         implicit_accidental = None
 
         # Handle carried accidentals
@@ -2146,14 +2197,12 @@ class NoteMixin:
 
         m21_note = note.Note(f"{pitch_name}{accidental}{octave}")
 
-        if m := match.group(4):
-            try:
-                length_modifier = self.abc_length(m)
-            except ABCException as e:
-                self.abc_debug("Fallback to note length modifier '1.0'.", token, e)
-                length_modifier = 1.0
-        else:
+        if components.length is None:
+            self.abc_debug("Fallback to note length modifier '1.0'.", token,
+                           ABCException('Incorrectly encoded or unparsable duration.'))
             length_modifier = 1.0
+        else:
+            length_modifier = components.length[0] / components.length[1]
 
         m21_note.quarterLength = length_modifier
 
@@ -2162,7 +2211,7 @@ class NoteMixin:
             if self.voice.overlay.courtesy:
                 m21_note.pitch.accidental.displayStyle = 'parentheses'
 
-        if match.group(5):
+        if components.tie:
             m21_note.tie = tie.Tie('start')
 
         return m21_note
@@ -2208,30 +2257,9 @@ class NoteMixin:
             float: The length modifier as a float.
         """
 
-        denominator: int = 1
-        while src.endswith('/'):
-            denominator *= 2
-            src = src[:-1]
-
-        if not src:
-            return 1.0 / denominator
-
-        try:
-            numerator = 1.0
-            if src.startswith('/'):
-                # common usage: /4 short for 1/4
-                denominator = int(src.lstrip('/'))
-            elif '/' in src:
-                # common usage: 3/4
-                n, d = src.split('/')
-                numerator, denominator = int(n), int(d)
-            elif src.isdigit():
-                numerator = int(src)
-
-            return numerator / denominator
-
-        except ValueError as e:
-            raise ABCException('Incorrectly encoded or unparsable duration.') from e
+        if (length := decode_length(src)) is None:
+            raise ABCException('Incorrectly encoded or unparsable duration.')
+        return length[0] / length[1]
 
     @staticmethod
     def abc_accidental(src: str) -> str:
@@ -2308,7 +2336,7 @@ class TuneBody(TuneHeader, NoteMixin):
             self.key_signature = tune_header.key_signature
         else:
             self.abc_debug("No valid key signature, default to 'C major'")
-            self.key_signature = key.Key('C')
+            self.key_signature = new_key('C', 'major')
 
         self.time_signature = tune_header.time_signature
         self.user_defined = tune_header.user_defined
@@ -2528,15 +2556,11 @@ class TuneBody(TuneHeader, NoteMixin):
         if self.voice.measure is None:
             self.voice.open_measure(key_signature=self.key_signature)
 
-        intern = token.src[1:-1]
-        slash = intern.startswith('/')
-        if slash:
-            intern = intern[1:]
-
-        tokens = list(tokenize(intern, abc_version=self.abc_version))
+        if not isinstance(token, GraceToken):
+            token = GraceToken(token.type, token.src, token.pos)
 
         # remember the grace notes to slur to a main note
-        self.voice.overlay.grace_notes = GraceNoteParser(self).process(tokens, slash)
+        self.voice.overlay.grace_notes = GraceNoteParser(self).process(token.notes, token.slash)
 
     def abc_key(self, token: Field):
         ks, _, _ = super().abc_key(token)
@@ -3222,7 +3246,10 @@ class TuneBody(TuneHeader, NoteMixin):
             # tune
             return list(k for k in self.voice_info.keys())
 
-    def process(self, token_generator: Iterator[Token]) -> stream.Score:
+    def process_tokens(self, token_generator: Iterator[Token]):
+        """
+        Process the tokens of the tune body until the end of the tune and close all voices.
+        """
         for token in token_generator:
             if token.type == 'Emptyline':
                 break
@@ -3231,6 +3258,65 @@ class TuneBody(TuneHeader, NoteMixin):
 
         self.part.close()
 
+    def process_fragment(self, token_generator: Iterator[Token]) -> stream.Part | stream.Score:
+        """
+        Process the tokens of an abc fragment without a tune header.
+
+        A fragment of a single voice is returned as a music21 part, made
+        directly of the measures of the voice. The score level processing
+        (combining the voices of the sections, synchronizing the measures of
+        the voices) is skipped. Any other fragment is returned as a music21
+        score like a tune.
+        """
+        self.process_tokens(token_generator)
+
+        m21_part = self.voice.part
+        if len(self.parts) > 1 or len(self.part._voices) > 1 or self.staves or self.midi \
+                or m21_part.quarterLength == 0:
+            return self.build_score()
+
+        m21_part.partName = self.voice.info.name
+        m21_part.partAbbreviation = self.voice.info.sub_name
+
+        # Move the score line breaks into the following measure, like combine_abc_parts
+        linebreak: bool = False
+        for element in list(m21_part.elements):
+            if isinstance(element, layout.SystemLayout):
+                m21_part.remove(element)
+                linebreak = True
+            elif isinstance(element, stream.Measure) and linebreak:
+                element.append(layout.SystemLayout(isNew=True))
+                linebreak = False
+
+        measures = list(m21_part.getElementsByClass(stream.Measure))
+        if self.part.tempo:
+            measures[0].insert(0, self.part.tempo)
+
+        # Number the measures and keep only the irregular bar lines, like fix_measures
+        for number, measure in enumerate(measures):
+            measure.number = number
+            if (bar_line := measure.leftBarline) and bar_line.type == 'regular':
+                measure.leftBarline = None
+            if (bar_line := measure.rightBarline) and bar_line.type == 'regular':
+                measure.rightBarline = None
+
+        try:
+            if measures[0].timeSignature and measures[0].barDurationProportion() < 1.0:
+                measures[0].padAsAnacrusis()
+        except Exception as e:
+            self.abc_debug("Error while analyzing an anacrusis in the fragment", exception=e)
+
+        return m21_part
+
+    def process(self, token_generator: Iterator[Token]) -> stream.Score:
+        self.process_tokens(token_generator)
+        return self.build_score()
+
+    def build_score(self) -> stream.Score:
+        """
+        Combine the voices of all sections into the parts of the music21 score
+        and synchronize the measures of the parts.
+        """
         parts = list(self.combine_abc_parts())
         for midi_channel, part in enumerate(parts, start=1):
             self.apply_midi(part, midi_channel)
@@ -3255,20 +3341,13 @@ class ChordParser(ABCParser, NoteMixin):
         self.octave = body_processor.octave
 
     def process(self, token: Token):
-
-        if token.src.startswith('+'):
-            # legacy chord style: +CEG+/2
-            intern_str, length_str = token.src[1:].split('+', 1)
-        else:
-            # recent chord style [CEG]/2
-            intern_str, length_str = token.src[1:].split(']', 1)
-
-        if chord_is_tied := length_str.endswith('-'):
-            length_str = length_str.rstrip('-')
+        if not isinstance(token, ChordToken):
+            token = ChordToken(token.type, token.src, token.pos)
+        chord_is_tied = token.tie
 
         m21_notes: list[note.Note] = []
 
-        for intern_token in tokenize(intern_str):
+        for intern_token in token.notes:
             m21_note: note.Note = self.abc_note(intern_token)
             m21_notes.append(m21_note)
 
@@ -3293,11 +3372,12 @@ class ChordParser(ABCParser, NoteMixin):
             t.quarterLength = m21_notes[0].quarterLength
 
         m21_chord = chord.Chord(m21_notes)
-        try:
-            chord_length_modifier = self.abc_length(length_str)
-        except ABCException as e:
+        if token.length is None:
             chord_length_modifier = 1.0
-            self.abc_debug("Fallback to chord length modifier '1.0'.", token, e)
+            self.abc_debug("Fallback to chord length modifier '1.0'.", token,
+                           ABCException('Incorrectly encoded or unparsable duration.'))
+        else:
+            chord_length_modifier = token.length[0] / token.length[1]
 
         m21_chord.quarterLength = m21_notes[0].quarterLength * chord_length_modifier
 
@@ -3316,7 +3396,7 @@ class GraceNoteParser(ABCParser, NoteMixin):
         self.quarterLength = 0.25
         self.octave: int = body_processor.octave
 
-    def process(self, intern: list[Token], slash: bool = False) -> list[music21.Music21Object]:
+    def process(self, intern: Iterable[Token], slash: bool = False) -> list[music21.Music21Object]:
         grace_notes: list[note.Note] = []
         for token in intern:
             if grace_note := self.abc_token(token):
@@ -0,0 +1,106 @@
+# -------------------------------------------------------------------------------
+# Name:         abc_to_music21/sources.py
+# Purpose:      Reading abc data from files, archives and file objects.
+#
+# Authors:      Marian Schulz
+#
+# Copyslack:    Copyright © 2023, Marian Schulz
+# License:      SSL - SUBGENIUS SOFTWARE LICENSE
+# -------------------------------------------------------------------------------
+"""
+Abc tune books are often stored compressed, as gzip, bz2 or xz files or as
+members of a zip archive. The compression is detected by the magic bytes at
+the beginning of the data, the decompressed data is streamed as text and never
+extracted to a file.
+
+>>> import gzip, io
+>>> data = io.BytesIO(gzip.compress(b'X:1\\r\\nT:Caf\\xc3\\xa9\\r\\nK:\\r\\nCEG\\r\\n'))
+>>> for book, source in iter_abc_books(data):
+...     print(source, book.read().split('\\n'))
+stream ['X:1', 'T:Café', 'K:', 'CEG', '']
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import zipfile
+from pathlib import Path
+from typing import BinaryIO, Iterator, TextIO, TypeAlias
+from abc_to_music21.parser import ABCException
+
+AbcSource: TypeAlias = str | Path | zipfile.Path | BinaryIO | TextIO
+
+# Magic bytes of the compressed file formats
+ZIP_MAGIC = b'PK\x03\x04'
+DECOMPRESSORS = {
+    b'\x1f\x8b': gzip.open,
+    b'BZh': bz2.open,
+    b'\xfd7zXZ\x00': lzma.open,
+}
+
+
+def iter_abc_books(src: AbcSource) -> Iterator[tuple[str | TextIO, str]]:
+    """
+    Open the tune books of an abc source one after another.
+
+    A string is abc data itself. Files (pathlib.Path), zip archive members
+    (zipfile.Path) and binary file objects may be compressed with gzip, bz2 or
+    xz; a zip archive contains a tune book in each member with the suffix
+    '.abc'. A text file object is read as it is. The abc data is decoded as
+    utf-8 with universal newlines.
+
+    Parameters:
+    - src: The abc data, a path, a zip archive member or a file object.
+
+    Returns: An iterator of (abc data or text stream, source) tuples, the source
+    is "string" or the name of the file. A text stream is open only until the
+    next tune book is requested.
+    """
+    if isinstance(src, str):
+        yield src, "string"
+    elif isinstance(src, (Path, zipfile.Path)):
+        with src.open('rb') as f:
+            yield from _iter_binary_books(f, f"{src}")
+    elif hasattr(src, 'read'):
+        source = f"{getattr(src, 'name', 'stream')}"
+        if isinstance(src.read(0), str):
+            yield src, source
+        else:
+            yield from _iter_binary_books(src, source)
+    else:
+        raise ABCException("Illegal abc input, chose a pathlib.Path, a file object or str")
+
+
+def _peek(f: BinaryIO, size: int) -> bytes:
+    # Read the first bytes without consuming them, a stream without peek or seek is not sniffed
+    if hasattr(f, 'peek'):
+        return f.peek(size)[:size]
+    if f.seekable():
+        pos = f.tell()
+        data = f.read(size)
+        f.seek(pos)
+        return data
+    return b''
+
+
+def _iter_binary_books(f: BinaryIO, source: str) -> Iterator[tuple[TextIO, str]]:
+    magic = _peek(f, 6)
+    if magic.startswith(ZIP_MAGIC):
+        with zipfile.ZipFile(f) as archive:
+            for name in archive.namelist():
+                if name.lower().endswith('.abc'):
+                    with archive.open(name) as member:
+                        yield from _iter_binary_books(member, f"{source}/{name}")
+        return
+
+    decompressor = next((d for m, d in DECOMPRESSORS.items() if magic.startswith(m)), None)
+    binary = f if decompressor is None else decompressor(f)
+    text = io.TextIOWrapper(binary, encoding='utf-8')
+    try:
+        yield text, source
+    finally:
+        # The file object belongs to the caller, closing the wrapper would close it
+        text.detach()
+        if decompressor is not None:
+            binary.close()
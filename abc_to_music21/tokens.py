@@ -34,12 +34,24 @@ By maintaining the correct order of tokens, you ensure that the tokenizer can
 accurately match and generate tokens from the input ABC notation.
 '''
 
+import codecs
+import mmap
+import os
 import re
-from typing import Iterator, TypeAlias
+import threading
+from array import array
+from bisect import bisect_right
+from collections import deque
+from functools import lru_cache, partial
+from itertools import chain
+from operator import itemgetter
+from pathlib import Path
+from typing import Iterable, Iterator, MutableSequence, NamedTuple, TextIO, TypeAlias
 from html import unescape
 
 # Type aliases
 ABCVersion: TypeAlias = tuple[int, int, int]
+ABCBytes: TypeAlias = bytes | bytearray | mmap.mmap
 
 # Constants and default values
 DEFAULT_VERSION: ABCVersion = (1, 6, 0)
@@ -48,17 +60,37 @@ DEFAULT_VERSION: ABCVersion = (1, 6, 0)
 class Token:
     """
     Represents a token in the ABC notation.
+
+    Tokens are immutable, a token may be shared by several token sequences
+    (see :func:`tokenize_cached`).
+
     Attributes:
         type (str): The type of the token
         src (str): The text of the token as it appears in the ABC code.
         pos (int): The position within the abc source where the token begins.
+        code (int): The integer code of the token type, see :func:`token_type_code`.
     """
-    __slots__ = ('type', 'src', 'pos')
+    __slots__ = ('type', 'src', 'pos', 'code')
 
     def __init__(self, token_type, src, pos: int = 0):
-        self.type: str = token_type
-        self.src: str = src
-        self.pos: int = pos
+        set_attr = object.__setattr__
+        set_attr(self, 'type', token_type)
+        set_attr(self, 'src', src)
+        set_attr(self, 'pos', pos)
+        set_attr(self, 'code', token_type_code(token_type))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Can't set attribute '{name}' of an immutable token")
+
+    def __reduce__(self):
+        # The codes of token types created at runtime differ between processes
+        return type(self), (self.type, self.src, self.pos)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def __str__(self):
         return f"<{self.type}: '{self.src}' (pos={self.pos})>"
@@ -70,24 +102,193 @@ class Token:
 class Field(Token):
     """
     Represents a field token in the ABC notation.
+
+    The tag and the data are taken from the text of the field when the token
+    is created, a field continued on the next line is a new token.
+
     Attributes:
         type (str): The type of the token
         src (str): The text of the token as it appears in the ABC code.
         pos (int): The position within the abc source where the token begins.
+        code (int): The integer code of the token type, see :func:`token_type_code`.
+        tag (str): The abc field tag (A,C,K..) of this field token.
+        data (str): The data of the field token, without the tag.
+
+    >>> field = Field('key', '[K: Am]')
+    >>> field.tag, field.data
+    ('K', 'Am')
     """
-    @property
-    def tag(self) -> str:
-        """
-        Returns the abc field tag (A,C,K..) of this field token
-        """
-        return self.src[1] if self.src.startswith('[') else self.src[0]
+    __slots__ = ('tag', 'data')
 
-    @property
-    def data(self):
-        """
-        Returns the data of the field token
-        """
-        return (self.src[3:-1] if self.src.startswith('[') else self.src[2:]).strip()
+    def __init__(self, token_type, src, pos: int = 0):
+        super().__init__(token_type, src, pos)
+        set_attr = object.__setattr__
+        if src.startswith('['):
+            # inline field [K:G]
+            set_attr(self, 'tag', src[1:2])
+            set_attr(self, 'data', src[3:-1].strip())
+        else:
+            set_attr(self, 'tag', src[:1])
+            set_attr(self, 'data', src[2:].strip())
+
+
+class NoteComponents(NamedTuple):
+    """
+    The components of an abc note, decoded by the tokenizer.
+
+    Attributes:
+        accidental (str): The accidental of the note ('^', '^^', '_', '__', '=' or '').
+        step (str): The letter of the note, a lower case letter is an octave higher.
+        octave (int): The octave marks, the number of "'" minus the number of ",".
+        length (tuple[int, int] | None): The numerator and denominator of the
+        length modifier, None if the length is unparsable.
+        tie (bool): True if the note is tied to the next note.
+    """
+    accidental: str
+    step: str
+    octave: int
+    length: tuple[int, int] | None
+    tie: bool
+
+
+# The components of an abc note: accidental, step, octave marks, length and tie
+ABC_RE_ABC_NOTE = re.compile(r'([\^_=]*)([A-Ga-g])([\',]*)([0-9/]*)([\-]*)')
+
+
+@lru_cache(maxsize=1024)
+def decode_length(src: str) -> tuple[int, int] | None:
+    """
+    Decode the length modifier of a note, rest or chord.
+
+    https://abcnotation.com/wiki/abc:standard:v2.1#lunit_note_length
+
+    Returns: The numerator and denominator, None if the length is unparsable.
+
+    >>> decode_length('3/2'), decode_length('//'), decode_length('/4'), decode_length('')
+    ((3, 2), (1, 4), (1, 4), (1, 1))
+    >>> decode_length('1/2/3') is None
+    True
+    """
+    denominator = 1
+    while src.endswith('/'):
+        denominator *= 2
+        src = src[:-1]
+
+    if not src:
+        return 1, denominator
+
+    try:
+        numerator = 1
+        if src.startswith('/'):
+            # common usage: /4 short for 1/4
+            denominator = int(src.lstrip('/'))
+        elif '/' in src:
+            # common usage: 3/4
+            n, d = src.split('/')
+            numerator, denominator = int(n), int(d)
+        elif src.isdigit():
+            numerator = int(src)
+        return numerator, denominator
+    except ValueError:
+        return None
+
+
+def decode_note(src: str) -> NoteComponents | None:
+    """
+    Decode the components of an abc note.
+
+    >>> decode_note("^c'3/2-")
+    NoteComponents(accidental='^', step='c', octave=1, length=(3, 2), tie=True)
+    >>> decode_note('z') is None
+    True
+    """
+    if not (match := ABC_RE_ABC_NOTE.match(src)):
+        return None
+    accidental, step, octave, length, tie = match.groups()
+    return NoteComponents(accidental, step, octave.count("'") - octave.count(','),
+                          decode_length(length), bool(tie))
+
+
+class NoteToken(Token):
+    """
+    A note token with the decoded components of the note.
+
+    Attributes:
+        components (NoteComponents | None): The components of the note, None
+        if the text of the token is not an abc note.
+    """
+    __slots__ = ('components',)
+
+    def __init__(self, token_type, src, pos: int = 0, components: NoteComponents | None = None):
+        super().__init__(token_type, src, pos)
+        object.__setattr__(self, 'components',
+                           decode_note(src) if components is None else components)
+
+
+class ChordToken(Token):
+    """
+    A chord token ([CEG]2 or +CEG+2) with the tokens of its notes.
+
+    The positions of the note tokens are relative to the chord interior.
+
+    Attributes:
+        notes (tuple[Token, ...]): The tokens of the chord interior.
+        length (tuple[int, int] | None): The numerator and denominator of the
+        length modifier of the chord, None if the length is unparsable.
+        tie (bool): True if the chord is tied to the next chord.
+
+    >>> chord = ChordToken('chord', '[CE]3/2-')
+    >>> chord.notes, chord.length, chord.tie
+    ((<note: 'C' (pos=0)>, <note: 'E' (pos=1)>), (3, 2), True)
+    """
+    __slots__ = ('notes', 'length', 'tie')
+
+    def __init__(self, token_type, src, pos: int = 0):
+        super().__init__(token_type, src, pos)
+        if src.startswith('+'):
+            # legacy chord style: +CEG+/2
+            interior, length = src[1:].split('+', 1)
+        else:
+            # recent chord style [CEG]/2
+            interior, length = src[1:].split(']', 1)
+        set_attr = object.__setattr__
+        set_attr(self, 'notes', tokenize_cached(interior))
+        set_attr(self, 'tie', length.endswith('-'))
+        set_attr(self, 'length', decode_length(length.rstrip('-')))
+
+
+class GraceToken(Token):
+    """
+    A grace note group token ({gab} or {/g}) with the tokens of its notes.
+
+    The positions of the note tokens are relative to the group interior.
+
+    Attributes:
+        notes (tuple[Token, ...]): The tokens of the grace note group.
+        slash (bool): True for an acciaccatura ({/g}).
+
+    >>> grace = GraceToken('grace_notes', '{/ga}')
+    >>> grace.notes, grace.slash
+    ((<note: 'g' (pos=0)>, <note: 'a' (pos=1)>), True)
+    """
+    __slots__ = ('notes', 'slash')
+
+    def __init__(self, token_type, src, pos: int = 0):
+        super().__init__(token_type, src, pos)
+        interior = src[1:-1]
+        slash = interior.startswith('/')
+        set_attr = object.__setattr__
+        set_attr(self, 'notes', tokenize_cached(interior[1:] if slash else interior))
+        set_attr(self, 'slash', slash)
+
+
+# The token classes of token types with structured tokens
+TOKEN_CLASSES: dict[str, type[Token]] = {
+    'note': NoteToken,
+    'chord': ChordToken,
+    'decoration_or_chord': ChordToken,
+    'grace_notes': GraceToken,
+}
 
 
 def abc_field_regex(tags: str) -> str:
@@ -98,10 +299,14 @@ def abc_field_regex(tags: str) -> str:
     inline_tags = [t for t in tags if t in "IKLMPQRNUV"]
     regexpr = rf'^[{tags}]:.*(\n|$)'
     if inline_tags:
-        regexpr += rf'|([\[]{"".join(inline_tags)}:[^\]\n%]*[\]])'
+        regexpr += rf'|([\[]{"".join(inline_tags)}:[^\[\]\n%]*[\]])'
     return regexpr
 
 
+# The token regular expressions run in linear time: no two quantifiers of a
+# pattern compete for the same characters, the body of a bracket excludes its
+# opening bracket, and a run of spaces or accidentals is only matched from its
+# first character (lookbehind), so an unclosed bracket or a long run fails fast.
 TOKEN_SPEC: list[tuple[str, str]] = [
     ('Directive', r'^[%]{2}.*\n'),
     ('f_meta_data', abc_field_regex('ABCDFGHNORSTWZX')),
@@ -117,14 +322,14 @@ TOKEN_SPEC: list[tuple[str, str]] = [
     ('f_symbol_line', abc_field_regex('s')),
     ('LineContinue', abc_field_regex('+')),
     ('tuplet', r'\([2-9]:[2-9]?:[2-9]|\([2-9]:[2-9]|\([2-9]'),
-    ('grace_notes', r'\{[^\}]*\}'),
+    ('grace_notes', r'\{[^\{\}]*\}'),
     ('bidirectonal_barline', r"|".join([r':+[\|\]][12]', r':+\|:+', r'\[\|:+', r':+\|\]',
                                         r'::+(?![\|\[])'])),
     ('end_repeat_barline', r"|".join([r':+[\|]', r'[\|\]][1-9]'])),
     ('start_repeat_barline', r'[\|]:+|\[[1-9]'),
     ('barline', r"|".join([r'\|\]', r'\[\|', r'\|\|(?![:])', r'\|'])),
     ('decoration', r'![^!%\[\]\|:\s]+!'),
-    ('chord', r'[\[][^\]:]*[\]][0-9]*[/]*[0-9]*(\s*[-])?'),
+    ('chord', r'[\[][^\[\]:]*[\]][0-9]*[/]*[0-9]*(\s*[-])?'),
     ('decoration_or_chord', r'[+][^+:\n]*[+][0-9]*[/]*[0-9]*(\s*[-])?'),
     ('unknown_decoration', r"![^!\n]!"),
     ('open_slur', r'[\.]?\('),
@@ -134,20 +339,179 @@ TOKEN_SPEC: list[tuple[str, str]] = [
     ('chord_symbol', r'"[^\^<>_@"][^"]*"'),
     ('overlay', r'&'),
     ('rest', r'[zZxX][0-9/]*(?!:)'),
-    ('note', r'[=_\^]*[a-gA-G][\',0-9/]*(\s*[-])?'),
+    ('note', r"(?<![=_\^])(?P<note_accidental>[=_\^]*)(?P<note_step>[a-gA-G])"
+             r"(?P<note_octave>[',]*)(?P<note_length>[0-9/]*)(?P<note_rest>[',0-9/]*)"
+             r"(?P<note_tie>\s*[-])?"),
     ('score_linebreak', r'[\$\!]'),
     ('user_symbol', r'[H-Wh-w~\.](?![:])'),
     ('EmptyLine', r'^([ \t]*[\n])+'),
     ('Skip', r'^%(?!%).*(\n|$)|%.*$'),
-    ('newline', r'[\\ ]*(%[^\n\\]*)?[\\]?[ \t]*\n'),
+    ('newline', r'((?<![\\ ])[\\ ]+)?(%[^\n\\]*([\\][ \t]*)?|\t[ \t]*)?\n'),
     ('unknown_token', r'\S')
     # ('Space', r'\s+')
 ]
 
+# The characters a match of a token type may start with, None if a match may
+# start with any character. scan_tokens only tries the token types whose first
+# characters include the character at the scan position, keep this table in
+# sync with TOKEN_SPEC.
+TOKEN_FIRST_CHARACTERS: dict[str, str | None] = {
+    'Directive': '%',
+    'f_meta_data': 'ABCDFGHNORSTWZX[',
+    'f_meter': 'M[',
+    'f_key': 'K[',
+    'f_part': 'P[',
+    'f_user_def': 'U[',
+    'f_lyrics': 'w',
+    'f_unit_note_length': 'L[',
+    'f_instruction': 'I[',
+    'f_tempo': 'Q[',
+    'f_voice': 'V[',
+    'f_symbol_line': 's',
+    'LineContinue': '+',
+    'tuplet': '(',
+    'grace_notes': '{',
+    'bidirectonal_barline': ':[',
+    'end_repeat_barline': ':|]',
+    'start_repeat_barline': '|[',
+    'barline': '|[',
+    'decoration': '!',
+    'chord': '[',
+    'decoration_or_chord': '+',
+    'unknown_decoration': '!',
+    'open_slur': '.(',
+    'close_slur': '.)',
+    'broken_rhythm': '<>',
+    'annotation': '"',
+    'chord_symbol': '"',
+    'overlay': '&',
+    'rest': 'zZxX',
+    'note': '=_^abcdefgABCDEFG',
+    'score_linebreak': '$!',
+    'user_symbol': 'HIJKLMNOPQRSTUVWhijklmnopqrstuvw~.',
+    'EmptyLine': ' \t\n',
+    'Skip': '%',
+    'newline': '\\ %\t\n',
+    'unknown_token': None,
+}
+
+# abc 2.0 only: a backslash at the end of a line continues the line
+ABC_20_LINE_CONTINUE_RE = re.compile(r'[\\]((\s*\n)|(\s*%.*\n))')
+ABC_20_LINE_CONTINUE_BYTES_RE = re.compile(ABC_20_LINE_CONTINUE_RE.pattern.encode('ascii'))
+# The size of the chunks of an abc 2.0 source joined at once
+TOKENIZE_CHUNK_SIZE = 1 << 16
+
 TOKEN_RE = re.compile(r"|".join(f'(?P<{name}>{regex})' for name, regex in TOKEN_SPEC),
                       flags=re.MULTILINE)
 
 
+def _dispatch_table(token_spec: list[tuple[str, str]], encoded: bool = False) -> \
+        tuple[dict[str | int, re.Pattern], re.Pattern]:
+    # For each first character a regular expression of the candidate token
+    # types (in the order of the token specification), and a regular expression
+    # of the token types which may start with any character. The encoded table
+    # is indexed by byte values and its regular expressions match bytes.
+    spec = [(name, regex, TOKEN_FIRST_CHARACTERS[name]) for name, regex in token_spec]
+
+    patterns: dict[tuple[str, ...], re.Pattern] = {}
+
+    def compile_candidates(char: str | None) -> re.Pattern:
+        candidates = tuple(name for name, _, chars in spec
+                           if chars is None or (char is not None and char in chars))
+        if candidates not in patterns:
+            pattern = r"|".join(f'(?P<{name}>{regex})' for name, regex, _ in spec
+                                if name in candidates)
+            patterns[candidates] = re.compile(pattern.encode('ascii') if encoded else pattern,
+                                              flags=re.MULTILINE)
+        return patterns[candidates]
+
+    first_chars = set(chain.from_iterable(chars for _, _, chars in spec if chars is not None))
+    return ({ord(char) if encoded else char: compile_candidates(char) for char in first_chars},
+            compile_candidates(None))
+
+
+# The first character dispatch of the tokenizer
+TOKEN_DISPATCH, TOKEN_DEFAULT_RE = _dispatch_table(TOKEN_SPEC)
+
+# The token regular expressions for utf-8 encoded abc data (see tokenize_bytes),
+# an unknown token is a whole utf-8 encoded character
+BYTES_TOKEN_SPEC: list[tuple[str, str]] = [
+    (name, r'[\xc0-\xff][\x80-\xbf]*|\S' if name == 'unknown_token' else regex)
+    for name, regex in TOKEN_SPEC]
+BYTES_TOKEN_DISPATCH, BYTES_TOKEN_DEFAULT_RE = _dispatch_table(BYTES_TOKEN_SPEC, encoded=True)
+# The utf-8 encoded white space characters matched by \s of the token regular
+# expressions, but not by \s of the bytes token regular expressions
+NON_ASCII_SPACE_BYTES_RE = re.compile(rb'[\x1c-\x1f]|\xc2[\x85\xa0]|\xe1\x9a\x80'
+                                      rb'|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]'
+                                      rb'|\xe2\x81\x9f|\xe3\x80\x80')
+
+
+# The free text after an empty line is skipped line by line up to the next
+# line which may start a field or a directive, or which may contain an inline
+# field or a token spanning several lines: grace notes, a chord or an
+# annotation whose quotes are not paired on the line.
+FREE_TEXT_TOKEN_TYPES = frozenset(name for name, _ in TOKEN_SPEC
+                                  if name.startswith('f_') or name == 'Directive')
+FREE_TEXT_LINE_RE = re.compile(
+    '^(?:[' + ''.join(re.escape(c) for c in sorted(set(chain.from_iterable(
+        TOKEN_FIRST_CHARACTERS[name] for name in FREE_TEXT_TOKEN_TYPES)))) + '][:%]'
+    r'|[^\n]*[{\[]'
+    r'|(?=[^\n]*")(?:[^\n]*(?:[!%+]|"")'  # other tokens may swallow quotes
+    r'|[^"\n]*"(?:[^"\n]*"[^"\n]*")*[^"\n]*$))',
+    flags=re.MULTILINE)
+FREE_TEXT_LINE_BYTES_RE = re.compile(FREE_TEXT_LINE_RE.pattern.encode('ascii'), flags=re.MULTILINE)
+
+
+def scan_tokens(src: str | ABCBytes, skip_free_text: bool = False,
+                pos: int = 0) -> Iterator[re.Match]:
+    """
+    Find the matches of the token regular expressions in the abc source from
+    pos on, like `TOKEN_RE.finditer(src, pos)`.
+
+    Instead of trying all alternatives of TOKEN_RE at each position, only the
+    token types which may start with the character at the position are tried
+    (in the order of TOKEN_SPEC).
+
+    The text after an empty line is free text, the tokenizer keeps only its
+    fields and directives. With skip_free_text the scanner jumps over the lines
+    of free text without a field or a directive (see FREE_TEXT_LINE_RE).
+
+    The source may also be utf-8 encoded abc data, the matches are then
+    matches of bytes (see :func:`tokenize_bytes`).
+
+    >>> [m.lastgroup for m in scan_tokens('K:G\\n|:A2 B:|')]
+    ['f_key', 'start_repeat_barline', 'note', 'note', 'end_repeat_barline']
+    >>> [m.group() for m in scan_tokens('A\\n\\nfree text\\nW:words\\n', skip_free_text=True)]
+    ['A', '\\n', '\\n', 'W:words\\n']
+    """
+    end = len(src)
+    free_text = False
+    if isinstance(src, str):
+        dispatch, default = TOKEN_DISPATCH.get, TOKEN_DEFAULT_RE
+        free_text_line, newline = FREE_TEXT_LINE_RE, '\n'
+    else:
+        dispatch, default = BYTES_TOKEN_DISPATCH.get, BYTES_TOKEN_DEFAULT_RE
+        free_text_line, newline = FREE_TEXT_LINE_BYTES_RE, ord('\n')
+    while pos < end:
+        if free_text and src[pos - 1] == newline:
+            if (line := free_text_line.search(src, pos)) is None:
+                return
+            pos = line.start()
+
+        m = dispatch(src[pos], default).match(src, pos)
+        if m is None:
+            pos += 1
+        else:
+            yield m
+            pos = m.end()
+            if skip_free_text and m.lastgroup == 'EmptyLine':
+                free_text = True
+
+
+# The text up to the first '%' outside of "" on the first line (in linear time)
+REMOVE_COMMENT_RE = re.compile(r'[^"%\n]*("[^"\n]*"[^"%\n]*)*')
+
+
 def remove_comment(text: str) -> str:
     """
     This method carefully removes comments, ensuring '%' is not enclosed
@@ -174,7 +538,8 @@ def remove_comment(text: str) -> str:
         ''
     """
 
-    return re.match(r'("[^"\n]*"|[^"%\n]*)*[^%]*', text).group(0).rstrip()
+    end = text.find('%', REMOVE_COMMENT_RE.match(text).end())
+    return (text if end < 0 else text[:end]).rstrip()
 
 
 def tokenize(src: str, abc_version: ABCVersion | None = DEFAULT_VERSION) -> Iterator[Token]:
@@ -197,40 +562,68 @@ def tokenize(src: str, abc_version: ABCVersion | None = DEFAULT_VERSION) -> Iter
         # the newline, to make one long logical line. There may appear spaces
         # or an end-of-line remark after the backslash: these will be deleted
         # as well.
-        src = re.sub(r'[\\]((\s*\n)|(\s*%.*\n))', '', src)
+        # The lines are joined chunk by chunk while scanning, without a copy
+        # of the whole source, the token positions are positions in src.
+        chunks = (src[i:i + TOKENIZE_CHUNK_SIZE] for i in range(0, len(src), TOKENIZE_CHUNK_SIZE))
+        yield from _tokenize_matches(_scan_joined_chunks(chunks))
+    else:
+        yield from _tokenize_matches((m.start(), m) for m in scan_tokens(src, True))
+
+
+def _tokenize_matches(matches: Iterator[tuple[int, re.Match]]) -> Iterator[Token]:
+    # The tokens of the token matches, each match with its position in the abc source
+    for pos, m, field in _token_matches(matches):
+        if field is not None:
+            yield field
+            continue
+
+        token_type = m.lastgroup
+        # Remove newline and whitespaces
+        if token_type == 'note':
+            yield NoteToken(token_type, m.group().strip(), pos, _note_components(m))
+        else:
+            yield TOKEN_CLASSES.get(token_type, Token)(token_type, m.group().strip(), pos)
+
+
+def _token_matches(matches: Iterator[tuple[int, re.Match]]) -> \
+        Iterator[tuple[int, re.Match, Field | None]]:
+    # The matches of the tokens of tokenize with their positions, and the field
+    # token of each field and directive. A field extended by a line continue is
+    # yielded as one match with the text of the extended field. The tokenizer
+    # and the token table are both built from these matches.
 
     # token buffer for line continue
-    token_buffer: list[Field] = []
+    token_buffer: list[tuple[int, re.Match, Field]] = []
     # line number of the token in the abc notation
     empty_line: bool = False
 
-    for m in TOKEN_RE.finditer(src):
+    for pos, m in matches:
         token_type = m.lastgroup
-        token_string = m.group()
 
         # Ignore anything but metadata, fields and directives
         # after an empty line appears
         if token_type.startswith('f_'):
-            token_type = token_type[2:]
             # Prepare this token from an abc string type field for a line
             # continue token (+:)
             # Other fields are not of type string and can't extend by using '+:'
 
             # String type fields may contain accents and ligatures
-            token_string = encode_accent_and_ligature(token_string.rstrip('\n').rstrip())
-            field = Field(token_type, remove_comment(token_string), m.start())
+            token_string = encode_accent_and_ligature(m.group().rstrip('\n').rstrip())
+            field = Field(token_type[2:], remove_comment(token_string), pos)
             # And add this token into the buffer
 
             # At first yield and empty the token buffer
             if token_buffer:
-                if token_buffer[0].src.endswith('\\') and token_buffer[0].tag == field.tag:
-                    token_buffer[0].src = token_buffer[0].src.rstrip("\\") + field.data
+                buffer_pos, buffer_match, buffer_field = token_buffer[0]
+                if buffer_field.src.endswith('\\') and buffer_field.tag == field.tag:
+                    token_buffer[0] = (buffer_pos, buffer_match,
+                                       _continue_field(buffer_field, field.data))
                     continue
 
                 yield from token_buffer
-                token_buffer = [field]
+                token_buffer = [(pos, m, field)]
             else:
-                token_buffer.append(field)
+                token_buffer.append((pos, m, field))
 
             continue
 
@@ -248,14 +641,14 @@ def tokenize(src: str, abc_version: ABCVersion | None = DEFAULT_VERSION) -> Iter
             case 'Skip':
                 continue
             case 'Directive':
-                token_string = remove_comment(token_string[2:-1])
-                token = Field('instruction', f'I:{token_string}', m.start())
+                token_string = remove_comment(m.group()[2:-1])
+                token = Field('instruction', f'I:{token_string}', pos)
                 if token_buffer:
                     # If the token buffer is not empty, add this token
                     # in the buffer
-                    token_buffer.append(token)
+                    token_buffer.append((pos, m, token))
                 else:
-                    yield token
+                    yield pos, m, token
                     # For the line continue a directive is just a comment
                 continue
             case 'LineContinue':
@@ -264,10 +657,12 @@ def tokenize(src: str, abc_version: ABCVersion | None = DEFAULT_VERSION) -> Iter
                     # stored in the token_buffer
 
                     # remove comments
-                    token_string = remove_comment(token_string)
+                    token_string = remove_comment(m.group())
                     # String type fields may contain accents and ligatures
                     token_string = encode_accent_and_ligature(token_string[2:])
-                    token_buffer[0].src = token_buffer[0].src.rstrip("\\") + " " + token_string
+                    buffer_pos, buffer_match, buffer_field = token_buffer[0]
+                    token_buffer[0] = (buffer_pos, buffer_match,
+                                       _continue_field(buffer_field, f" {token_string}"))
                 else:
                     print(f"Skip '{token_type}' "
                           f"there was no previous abc string field to continue.")
@@ -280,14 +675,649 @@ def tokenize(src: str, abc_version: ABCVersion | None = DEFAULT_VERSION) -> Iter
                 yield from token_buffer
                 token_buffer = []
 
-        # Remove newline and whitespaces
-        yield Token(token_type, token_string.strip(), m.start())
+        yield pos, m, None
 
     # yield the token buffer (if not empty)
     if token_buffer:
         yield from token_buffer
 
 
+def tokenize_stream(stream: TextIO, abc_version: ABCVersion | None = DEFAULT_VERSION,
+                    chunk_size: int = 1 << 16) -> Iterator[Token]:
+    """
+    Tokenizes ABC notation read from a text stream, like :func:`tokenize` the
+    complete text of the stream, but without reading the whole text at once.
+
+    The stream is read in chunks of chunk_size characters. Only the text
+    which is not tokenized yet is kept, this is usually the last lines read,
+    but a construct spanning several lines (like an annotation without a
+    closing quote) is kept until it's complete. The token positions are
+    offsets in the text of the stream.
+
+    Args:
+        stream (TextIO): The text stream of the ABC notation.
+        abc_version (tuple[int, int, int], optional): The ABC notation version.
+        chunk_size (int): The number of characters read at once.
+
+    >>> import io
+    >>> list(tokenize_stream(io.StringIO('T:Title\\n+:continued\\nCD'), chunk_size=4))
+    [<meta_data: 'T:Title continued' (pos=0)>, <note: 'C' (pos=20)>, <note: 'D' (pos=21)>]
+    """
+    chunks = iter(partial(stream.read, chunk_size), '')
+    if abc_version == (2, 0, 0):
+        yield from _tokenize_matches(_scan_joined_chunks(chunks))
+    else:
+        yield from _tokenize_matches(_scan_chunks(chunks))
+
+
+def tokenize_bytes(data: ABCBytes,
+                   abc_version: ABCVersion | None = DEFAULT_VERSION) -> Iterator[Token]:
+    """
+    Tokenizes utf-8 encoded ABC notation, like :func:`tokenize` the decoded
+    text with universal newlines, but without decoding the whole data.
+
+    The data may be a memory map of an abc file. The token regular expressions
+    match the bytes, and only the text of each token is decoded. The token
+    positions are byte offsets in the data.
+
+    Data with '\\r' line ends, with abc 2.0 line continuations or with white
+    space outside of ASCII (e.g. a no-break space pasted from a web page, which
+    is not white space for the bytes regular expressions) is decoded and
+    tokenized chunk by chunk as text, like :func:`tokenize_stream`.
+
+    >>> list(tokenize_bytes('T:Café\\r\\nK:G\\r\\nA'.encode()))
+    [<meta_data: 'T:Café' (pos=0)>, <key: 'K:G' (pos=9)>, <note: 'A' (pos=14)>]
+    >>> [(t.type, t.pos) for t in tokenize_bytes('T:Café\\nA\\u00a0-A'.encode())]
+    [('meta_data', 0), ('note', 8), ('note', 12)]
+    """
+    if data.find(b'\r') < 0 and not NON_ASCII_SPACE_BYTES_RE.search(data) and not (
+            abc_version == (2, 0, 0) and ABC_20_LINE_CONTINUE_BYTES_RE.search(data)):
+        yield from _tokenize_matches(_decoded_matches(scan_tokens(data, True)))
+        return
+
+    texts: deque[str] = deque()
+    line_ends: deque[tuple[int, int]] = deque()
+    chunks = _decode_chunks(data, texts, line_ends)
+    if abc_version == (2, 0, 0):
+        matches = _scan_joined_chunks(chunks)
+    else:
+        matches = _scan_chunks(chunks)
+    yield from _tokenize_matches(_byte_positions(_continued_positions(matches, line_ends), texts))
+
+
+def tokenize_file(path: str | Path, abc_version: ABCVersion | None = DEFAULT_VERSION) -> \
+        Iterator[Token]:
+    """
+    Tokenizes a utf-8 encoded abc file, memory-mapped, see :func:`tokenize_bytes`.
+
+    The file stays mapped until the tokens are consumed or the iterator is closed.
+    """
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from tokenize_bytes(data, abc_version)
+
+
+class _DecodedMatch:
+    # A match of utf-8 encoded abc data returning the text of its groups
+    __slots__ = ('match', 'lastgroup')
+
+    def __init__(self, match: re.Match):
+        self.match = match
+        self.lastgroup = match.lastgroup
+
+    def group(self, *groups):
+        if not groups:
+            return self.match.group().decode()
+        return _decode_groups(self.match.group(*groups))
+
+
+@lru_cache(maxsize=1024)
+def _decode_groups(groups: tuple[bytes | None, ...]) -> tuple[str | None, ...]:
+    # The text of the groups of a match, the groups of the notes repeat often
+    return tuple(None if g is None else g.decode() for g in groups)
+
+
+def _decoded_matches(matches: Iterator[re.Match]) -> Iterator[tuple[int, _DecodedMatch]]:
+    # The matches of utf-8 encoded abc data as matches of the text, each match
+    # with its position. The bytes regular expressions know only ascii white
+    # space, other white space characters are unknown tokens.
+    for m in matches:
+        if m.lastgroup == 'unknown_token' and m.group().decode().isspace():
+            continue
+        yield m.start(), _DecodedMatch(m)
+
+
+def _decode_chunks(data: ABCBytes, texts: MutableSequence[str],
+                   line_ends: MutableSequence[tuple[int, int]]) -> Iterator[str]:
+    # Decode utf-8 encoded abc data chunk by chunk with universal newlines. The
+    # decoded text of each chunk is appended to texts. For each '\r\n' replaced
+    # by '\n' the position after the '\n' in the text with universal newlines and
+    # the number of '\r' removed up to the position are appended to line_ends,
+    # like the line continuations of _join_continued_lines: a token at the '\n'
+    # is at the '\r'.
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = (data[i:i + TOKENIZE_CHUNK_SIZE] for i in range(0, len(data), TOKENIZE_CHUNK_SIZE))
+    text = ''
+    offset = removed_length = 0
+    for chunk in chain(chunks, [b'']):
+        text += decoder.decode(chunk, not chunk)
+        # A '\r' at the end of the chunk may be followed by '\n'
+        end = len(text) - 1 if chunk and text.endswith('\r') else len(text)
+        decoded, text = text[:end], text[end:]
+        if not decoded:
+            continue
+        texts.append(decoded)
+        pos = decoded.find('\r\n')
+        while pos >= 0:
+            line_ends.append((offset + pos + 1 - removed_length, removed_length + 1))
+            removed_length += 1
+            pos = decoded.find('\r\n', pos + 2)
+        offset += len(decoded)
+        yield decoded.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def _final_length(text: str) -> int:
+    # The length of the text which doesn't depend on the text following it:
+    # the token regular expressions read at most up to the first non-blank
+    # character after a match, the text up to the last non-blank line is final.
+    end = len(text)
+    while end > 0:
+        start = text.rfind('\n', 0, end) + 1
+        if text[start:end].strip():
+            return start
+        end = start - 1
+    return 0
+
+
+def _join_continued_lines(chunks: Iterable[str],
+                          continuations: MutableSequence[tuple[int, int]]) -> Iterator[str]:
+    # Remove the abc 2.0 line continuations from the text chunks. For each line
+    # continuation the position in the joined text and the number of characters
+    # removed up to the position are appended to continuations.
+    text = ''
+    joined_length = 0
+    removed_length = 0
+    for chunk in chain(chunks, [None]):
+        if chunk is None:
+            final = len(text)
+        else:
+            text += chunk
+            if not (final := _final_length(text)):
+                continue
+
+        pieces = []
+        last = 0
+        for m in ABC_20_LINE_CONTINUE_RE.finditer(text, 0, final):
+            pieces.append(text[last:m.start()])
+            joined_length += m.start() - last
+            removed_length += m.end() - m.start()
+            continuations.append((joined_length, removed_length))
+            last = m.end()
+        pieces.append(text[last:final])
+        joined_length += final - last
+        yield ''.join(pieces)
+        text = text[final:]
+
+
+def _scan_joined_chunks(chunks: Iterator[str]) -> Iterator[tuple[int, re.Match]]:
+    # Find the token matches in the text chunks with the abc 2.0 line continuations
+    # removed, each match with its position in the text with the line continuations.
+    continuations: deque[tuple[int, int]] = deque()
+    yield from _continued_positions(
+        _scan_chunks(_join_continued_lines(chunks, continuations)), continuations)
+
+
+def _byte_positions(matches: Iterator[tuple[int, re.Match]],
+                    texts: deque[str]) -> Iterator[tuple[int, re.Match]]:
+    # The matches in the text of the chunks in texts, each with the utf-8 byte
+    # offset of its position. The chunks are appended while the matches are
+    # found, a chunk is removed when the matches are past it.
+    byte_pos = char_pos = start = 0
+    for pos, m in matches:
+        while pos >= start + len(texts[0]):
+            text = texts.popleft()
+            byte_pos += len(text[char_pos - start:].encode())
+            start += len(text)
+            char_pos = start
+        byte_pos += len(texts[0][char_pos - start:pos - start].encode())
+        char_pos = pos
+        yield byte_pos, m
+
+
+def _continued_positions(matches: Iterator[tuple[int, re.Match]],
+                         continuations: deque[tuple[int, int]]) -> Iterator[tuple[int, re.Match]]:
+    # The matches in the text with the line continuations removed, each match
+    # with its position in the text with the line continuations.
+    removed_length = 0
+    for pos, m in matches:
+        while continuations and continuations[0][0] <= pos:
+            removed_length = continuations.popleft()[1]
+        yield pos + removed_length, m
+
+
+# A token of one of these characters may be a quote, grace note group or chord
+# whose end is not read yet.
+UNCLOSED_OPENERS = frozenset('"{[')
+
+
+def _scan_chunks(chunks: Iterator[str]) -> Iterator[tuple[int, re.Match]]:
+    # Find the token matches in the text chunks like scan_tokens finds them in
+    # the joined text, each match with its position in the joined text.
+    text = ''
+    offset = 0
+    pos = 0
+    # Free text after an empty line, see scan_tokens
+    free_text = False
+    dispatch = TOKEN_DISPATCH.get
+    default = TOKEN_DEFAULT_RE
+    for chunk in chain(chunks, [None]):
+        if chunk is None:
+            final = end = len(text)
+        else:
+            text += chunk
+            final = _final_length(text)
+            # The text up to the final length is scanned, but a match may extend to the end
+            end = len(text)
+
+        while pos < final:
+            if free_text and (pos == 0 or text[pos - 1] == '\n'):
+                if (line := FREE_TEXT_LINE_RE.search(text, pos, final)) is None:
+                    pos = final
+                    break
+                pos = line.start()
+
+            m = dispatch(text[pos], default).match(text, pos, end)
+            if m is None:
+                pos += 1
+                continue
+            if chunk is not None and (m.end() > final or (
+                    text[pos] in UNCLOSED_OPENERS and m.lastgroup == 'unknown_token')):
+                # Wait for the following text
+                break
+            free_text = free_text or m.lastgroup == 'EmptyLine'
+            yield offset + m.start(), m
+            pos = m.end()
+
+        # Keep the line of the scan position, the regular expressions anchor at line starts
+        line_start = text.rfind('\n', 0, pos) + 1
+        text = text[line_start:]
+        offset += line_start
+        pos -= line_start
+
+
+def _note_components(m: re.Match) -> NoteComponents:
+    # The components of a note from the groups of the note token regular
+    # expression, the same components as decode_note(m.group())
+    accidental, step, octave, length, rest, tie = m.group(
+        'note_accidental', 'note_step', 'note_octave', 'note_length', 'note_rest', 'note_tie')
+    return NoteComponents(accidental, step,
+                          octave.count("'") - octave.count(',') if octave else 0,
+                          decode_length(length),
+                          # A tie is only recognized directly after the length
+                          not rest and tie is not None and tie.startswith('-'))
+
+
+def _continue_field(field: Field, data: str) -> Field:
+    # The field extended by the data of the next line
+    return Field(field.type, field.src.rstrip("\\") + data, field.pos)
+
+
+# The maximum number of token sequences cached by tokenize_cached
+TOKENIZE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=TOKENIZE_CACHE_SIZE)
+def tokenize_cached(src: str, abc_version: ABCVersion | None = DEFAULT_VERSION) -> \
+        tuple[Token, ...]:
+    """
+    Tokenizes a short abc source like :func:`tokenize` and caches the tokens.
+
+    The interior of chords and grace note groups and the definitions of user
+    symbols repeat often within a tune book, the cached tokens are shared by
+    all callers. The statistics of the cache are reported by
+    `tokenize_cached.cache_info()`.
+
+    >>> tokenize_cached('CEG') is tokenize_cached('CEG')
+    True
+    >>> tokenize_cached('CEG')
+    (<note: 'C' (pos=0)>, <note: 'E' (pos=1)>, <note: 'G' (pos=2)>)
+    """
+    return tuple(tokenize(src, abc_version))
+
+
+# The integer codes of the token types are the indices into TOKEN_TYPES
+TOKEN_TYPES: tuple[str, ...] = tuple(name for name, _ in TOKEN_SPEC)
+TOKEN_CODES: dict[str, int] = {name: code for code, name in enumerate(TOKEN_TYPES)}
+# The type of the tokens created by the tokenizer for the token types
+TOKEN_NAMES: tuple[str, ...] = tuple(
+    name[2:] if name.startswith('f_') else 'instruction' if name == 'Directive' else name
+    for name in TOKEN_TYPES)
+FIELD_CODES: frozenset[int] = frozenset(code for code, name in enumerate(TOKEN_TYPES)
+                                        if name.startswith('f_') or name == 'Directive')
+
+# The token types interned as integer codes. The types created by the tokenizer
+# have fixed codes, other token types get the next free code at their first use.
+TOKEN_TYPE_NAMES: list[str] = list(dict.fromkeys(TOKEN_NAMES))
+TOKEN_TYPE_CODES: dict[str, int] = {name: code for code, name in enumerate(TOKEN_TYPE_NAMES)}
+_token_type_lock = threading.Lock()
+
+
+def token_type_code(token_type: str) -> int:
+    """
+    Returns the integer code of a token type, the code of a new token type is
+    the next free index into TOKEN_TYPE_NAMES.
+
+    >>> TOKEN_TYPE_NAMES[token_type_code('note')]
+    'note'
+    >>> token_type_code('key') == Field('key', 'K:G').code
+    True
+    """
+    code = TOKEN_TYPE_CODES.get(token_type)
+    if code is None:
+        with _token_type_lock:
+            code = TOKEN_TYPE_CODES.get(token_type)
+            if code is None:
+                code = len(TOKEN_TYPE_NAMES)
+                TOKEN_TYPE_NAMES.append(token_type)
+                TOKEN_TYPE_CODES[token_type] = code
+    return code
+
+
+class TokenTable:
+    """
+    A compact table of the tokens of an abc source.
+
+    Instead of a Token object with a copy of its text for each token, the
+    table stores the integer type code (see TOKEN_TYPES) and the start and end
+    offset of each token in arrays. The text of a token is sliced from the
+    source when it is requested. Only the text of fields extended by a line
+    continue is stored.
+
+    Iterating over the table creates the tokens of :func:`tokenize`, so the
+    table can be processed by an ABCParser.
+
+    Attributes:
+        src (str): The abc source, for abc 2.0 with the line continuations removed.
+        types (array): The type codes of the tokens.
+        starts (array): The positions in src where the tokens begin.
+        ends (array): The positions in src where the tokens end.
+        texts (dict[int, str]): The text of the fields extended by a line continue.
+        continuations (list[tuple[int, int]]): The positions in src of the
+        removed abc 2.0 line continuations with the number of characters
+        removed up to the position.
+
+    >>> table = tokenize_table('K:G\\n|:A2 B:|')
+    >>> len(table), table.type(1), table.text(2)
+    (5, 'start_repeat_barline', 'A2')
+    >>> table[0]
+    <key: 'K:G' (pos=0)>
+    """
+    __slots__ = ('src', 'types', 'starts', 'ends', 'texts', 'continuations')
+
+    def __init__(self, src: str, continuations: list[tuple[int, int]] | None = None):
+        self.src: str = src
+        self.continuations: list[tuple[int, int]] = continuations or []
+        self.types: array = array('B')
+        self.starts: array = array('i')
+        self.ends: array = array('i')
+        self.texts: dict[int, str] = {}
+
+    def append(self, code: int, start: int, end: int):
+        """
+        Append a token of type code at the source positions start to end.
+        """
+        self.types.append(code)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def type(self, index: int) -> str:
+        """
+        Returns the type of the token at index, as the type of a Token.
+        """
+        return TOKEN_NAMES[self.types[index]]
+
+    def text(self, index: int) -> str:
+        """
+        Returns the text of the token at index, as the src of a Token.
+        """
+        if index in self.texts:
+            return self.texts[index]
+
+        code = self.types[index]
+        text = self.src[self.starts[index]:self.ends[index]]
+        if TOKEN_TYPES[code] == 'Directive':
+            return f'I:{remove_comment(text[2:-1])}'
+        if code in FIELD_CODES:
+            return remove_comment(encode_accent_and_ligature(text.rstrip('\n').rstrip()))
+        return text.strip()
+
+    def position(self, index: int) -> int:
+        """
+        Returns the position of the token at index in the abc source with the
+        line continuations, as the pos of a Token.
+        """
+        pos = self.starts[index]
+        if i := bisect_right(self.continuations, pos, key=itemgetter(0)):
+            return pos + self.continuations[i - 1][1]
+        return pos
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def __getitem__(self, index: int) -> Token:
+        token_type = self.type(index)
+        token_class = Field if self.types[index] in FIELD_CODES else \
+            TOKEN_CLASSES.get(token_type, Token)
+        return token_class(token_type, self.text(index), self.position(index))
+
+    def __iter__(self) -> Iterator[Token]:
+        for index in range(len(self.types)):
+            yield self[index]
+
+
+def tokenize_table(src: str, abc_version: ABCVersion | None = DEFAULT_VERSION) -> TokenTable:
+    """
+    Tokenizes the input ABC notation source code into a TokenTable, the table
+    contains the tokens of :func:`tokenize`.
+
+    Args:
+        src (str): The input ABC notation source code.
+        abc_version (tuple[int, int, int], optional): The ABC notation version.
+        Defaults to MIN_VERSION.
+
+    Returns:
+        TokenTable: The table of the tokens.
+    """
+    continuations: list[tuple[int, int]] = []
+    if abc_version == (2, 0, 0):
+        # Append lines ending with a backslash to the next line, see tokenize
+        src = ''.join(_join_continued_lines([src], continuations))
+
+    table = TokenTable(src, continuations)
+    codes = TOKEN_CODES
+    for _, m, field in _token_matches((m.start(), m) for m in scan_tokens(src, True)):
+        table.append(codes[m.lastgroup], m.start(), m.end())
+        # The text of a field extended by a line continue differs from its match
+        if field is not None and field.src != table.text(len(table) - 1):
+            table.texts[len(table) - 1] = field.src
+
+    return table
+
+
+class TokenSpan(NamedTuple):
+    """
+    The type and the position of a token in the text of an IncrementalTokenizer.
+    """
+    type: str
+    start: int
+    end: int
+
+
+class TokenChange(NamedTuple):
+    """
+    The tokens lexed again after an edit of an IncrementalTokenizer, they
+    replace all previous tokens in the text from start to end.
+    """
+    start: int
+    end: int
+    spans: list[TokenSpan]
+
+
+# The characters which end the scan of an unclosed bracket
+UNCLOSED_OPENER_STOPS = {'"': '"', '{': '{}', '[': '[]:'}
+NON_SPACE_RE = re.compile(r'\S')
+
+
+class IncrementalTokenizer:
+    """
+    Keeps the token spans of an abc text line by line, for the syntax
+    highlighting of an editor.
+
+    An edit lexes the text again from the last line start before the edit where
+    the scanner can restart, up to the first line start after the edit where
+    the new tokens meet the previous tokens. The cost of an edit depends on the
+    lines changed, not on the size of the text.
+
+    A line start is a restart point unless a token before it crosses it, or
+    depends on the text from the edit on: a note looking for a tie over the
+    following white space, or a quote, grace note or chord bracket which is not
+    closed. The spans are the matches of :func:`scan_tokens`, fields are not
+    joined with their continuations (`+:` lines and abc 2.0 line continuations),
+    so a continuation group needs no special restart point.
+
+    Attributes:
+        text (str): The abc text.
+        line_starts (list[int]): The positions in text where the lines begin.
+        line_spans (list[list[tuple[str, int, int]]]): The (type, start, end) of
+        the tokens beginning in each line, relative to the start of the line.
+
+    >>> tokenizer = IncrementalTokenizer('K:G\\nABc|\\n')
+    >>> change = tokenizer.edit(5, 1, '"Am"B')
+    >>> change.start, change.end, [tokenizer.text[s.start:s.end] for s in change.spans]
+    (4, 13, ['A', '"Am"', 'B', 'c', '|', '\\n'])
+    >>> tokenizer.spans(0)
+    [TokenSpan(type='f_key', start=0, end=4)]
+    """
+    __slots__ = ('text', 'line_starts', 'line_spans')
+
+    def __init__(self, text: str = ''):
+        self.text: str = ''
+        self.line_starts: list[int] = [0]
+        self.line_spans: list[list[tuple[str, int, int]]] = [[]]
+        self.edit(0, 0, text)
+
+    def edit(self, offset: int, removed: int, inserted: str) -> TokenChange:
+        """
+        Replace the removed number of characters at offset with the inserted
+        text and lex the text again where the tokens may have changed.
+
+        Returns: The new tokens and the part of the text they cover.
+        """
+        if not 0 <= offset <= offset + removed <= len(self.text):
+            raise ValueError(f"Can't remove {removed} characters at {offset} "
+                             f"from a text of {len(self.text)} characters")
+
+        starts = self.line_starts
+        first = self._restart_line(offset)
+        text = self.text = self.text[:offset] + inserted + self.text[offset + removed:]
+        delta = len(inserted) - removed
+        edit_end = offset + len(inserted)
+
+        new_starts: list[int] = []
+        new_spans: list[list[tuple[str, int, int]]] = []
+        line_start = last_end = starts[first]
+        last = len(starts)
+        matches = scan_tokens(text, pos=line_start)
+        m = next(matches, None)
+        while True:
+            line_end = text.find('\n', line_start) + 1
+            spans = []
+            while m is not None and (not line_end or m.start() < line_end):
+                spans.append((m.lastgroup, m.start() - line_start, m.end() - line_start))
+                last_end = m.end()
+                m = next(matches, None)
+            new_starts.append(line_start)
+            new_spans.append(spans)
+            if not line_end:
+                end = len(text)
+                break
+
+            line_start = line_end
+            if line_start > edit_end and last_end <= line_start:
+                # The text from here on is unchanged, keep the previous tokens
+                # unless one of them crosses the line start
+                line = bisect_right(starts, line_start - delta) - 1
+                if self._last_end(line) <= starts[line]:
+                    last, end = line, line_start
+                    break
+
+        self.line_starts = starts[:first] + new_starts + [s + delta for s in starts[last:]]
+        self.line_spans[first:last] = new_spans
+        return TokenChange(new_starts[0], end, [
+            TokenSpan(token_type, line_start + start, line_start + end)
+            for line_start, spans in zip(new_starts, new_spans)
+            for token_type, start, end in spans])
+
+    def spans(self, index: int) -> list[TokenSpan]:
+        """
+        Returns the spans of the tokens beginning in the line at index.
+        """
+        line_start = self.line_starts[index]
+        return [TokenSpan(token_type, line_start + start, line_start + end)
+                for token_type, start, end in self.line_spans[index]]
+
+    def _last_end(self, index: int) -> int:
+        # The end of the last token beginning before the line at index
+        for line in range(index - 1, -1, -1):
+            if spans := self.line_spans[line]:
+                return self.line_starts[line] + spans[-1][2]
+        return 0
+
+    def _restart_line(self, offset: int) -> int:
+        # The index of the last line beginning before offset where the scanner can restart
+        index = bisect_right(self.line_starts, offset) - 1
+        while (line := self._unsafe_line(index, offset)) is not None:
+            index = line
+        return index
+
+    def _unsafe_line(self, index: int, offset: int) -> int | None:
+        # The line of a token before the line at index which crosses its start or
+        # depends on the text from offset on
+        starts, text = self.line_starts, self.text
+        line_start = starts[index]
+
+        # A token followed by white space up to the line start may look ahead
+        # to the next other character (a tie, an empty line)
+        space = line_start
+        while space > 0 and text[space - 1].isspace():
+            space -= 1
+        lookahead = NON_SPACE_RE.search(text, line_start)
+        lookahead_end = len(text) if lookahead is None else lookahead.start()
+        tokens = ((line, starts[line] + end) for line in range(index - 1, -1, -1)
+                  for _, _, end in reversed(self.line_spans[line]))
+        for line, end in tokens:
+            if end > line_start or (end >= space and lookahead_end >= offset):
+                return line
+            if end < space:
+                break
+
+        # An unclosed bracket scans the text up to its next stop character
+        for opener, stops in UNCLOSED_OPENER_STOPS.items():
+            pos = max(text.rfind(stop, 0, offset) for stop in stops)
+            if 0 <= pos < line_start and text[pos] == opener:
+                line = bisect_right(starts, pos) - 1
+                if ('unknown_token', pos - starts[line], pos - starts[line] + 1) \
+                        in self.line_spans[line]:
+                    return line
+        return None
+
+    def __iter__(self) -> Iterator[TokenSpan]:
+        for index in range(len(self.line_starts)):
+            yield from self.spans(index)
+
+
 ACCENT_AND_LIGATURES = {
     '\\"A': 'Ä', '\\"E': 'Ë',
     '\\"I': 'Ï', '\\"O': 'Ö', '\\"U': 'Ü', '\\"Y': 'Ÿ', '\\"a': 'ä', '\\"e': 'ë', '\\"i': 'ï',
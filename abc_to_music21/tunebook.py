@@ -0,0 +1,366 @@
+# -------------------------------------------------------------------------------
+# Name:         abc_to_music21/tunebook.py
+# Purpose:      Random access to the tunes of large abc tune book files.
+#
+# Authors:      Marian Schulz
+#
+# Copyslack:    Copyright © 2023, Marian Schulz
+# License:      SSL - SUBGENIUS SOFTWARE LICENSE
+# -------------------------------------------------------------------------------
+"""
+A tune book file may contain thousands of tunes, but often only a single tune
+is requested. The :class:`~TuneBookIndex` memory-maps a tune book file and
+records the byte offsets of the file header and of each tune, a tune is then
+translated without reading or splitting the whole tune book again.
+"""
+
+import hashlib
+import mmap
+import re
+import sqlite3
+from pathlib import Path
+from typing import Iterator, NamedTuple
+from music21 import stream, key
+from abc_to_music21 import translate_file_header, translate_tune, translate_tune_header
+from abc_to_music21.parser import ABCException, FileHeader, TuneHeader
+from abc_to_music21.tokens import remove_comment, encode_accent_and_ligature
+
+# Byte regular expressions to index the tune book
+RE_BYTES_X_FIELD = re.compile(rb'^X:.*$', flags=re.MULTILINE)
+RE_BYTES_TITLE_FIELD = re.compile(rb'^T:.*$', flags=re.MULTILINE)
+RE_BYTES_KEY_FIELD = re.compile(rb'^K:.*$', flags=re.MULTILINE)
+
+
+def decode_abc(data: bytes) -> str:
+    """
+    Decode utf-8 abc data with universal newlines, like a file opened in text mode.
+
+    >>> decode_abc(b'T:Caf\\xc3\\xa9\\r\\nK:\\r\\n')
+    'T:Café\\nK:\\n'
+    """
+    return data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+class TuneEntry(NamedTuple):
+    """
+    The location of a single tune in a tune book file.
+
+    Attributes:
+        number (str): The reference number of the tune (the data of the X: field).
+        titles (tuple[str, ...]): The titles (T: fields) in the tune header.
+        start (int): The byte offset of the X: field.
+        body (int): The byte offset right behind the X: field.
+        header_end (int): The byte offset right behind the K: field of the tune header.
+        end (int): The byte offset where the tune ends.
+    """
+    number: str
+    titles: tuple[str, ...]
+    start: int
+    body: int
+    header_end: int
+    end: int
+
+
+class TuneBookIndex:
+    """
+    Index of the tunes in an abc tune book file.
+
+    The file is memory-mapped and scanned once for the X: fields and the titles
+    in the tune headers. The file header is processed only once, on the first
+    translation, and shared by all tunes. A tune is looked up by its reference
+    number or by its title, and only the bytes of this tune are decoded and
+    translated.
+
+    Args:
+        path (Path): The path of the abc tune book file.
+
+    Examples:
+
+    >>> index = TuneBookIndex(Path('../abc/avemaria.abc'))
+    >>> len(index)
+    1
+    >>> index.find(number=1).titles
+    ("Ave Maria (Ellen's Gesang III) - Page 1",)
+    >>> index.translate(number=1)
+    <music21.stream.Score X:1 (file='../abc/avemaria.abc')>
+    >>> index.close()
+    """
+
+    def __init__(self, path: Path):
+        self.path: Path = path
+        self.entries: list[TuneEntry] = []
+        self._numbers: dict[str, TuneEntry] = {}
+        self._titles: dict[str, TuneEntry] = {}
+        self._file_header: tuple[FileHeader, dict[str, str]] | None = None
+
+        # An empty file can't be memory-mapped
+        self.data: mmap.mmap | bytes = b''
+        with path.open('rb') as f:
+            if path.stat().st_size:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._index()
+
+    def _index(self):
+        data = self.data
+        x_fields = list(RE_BYTES_X_FIELD.finditer(data))
+        # The file header ends with the first X: field
+        self.file_header_end: int = x_fields[0].start() if x_fields else len(data)
+
+        for i, match in enumerate(x_fields):
+            end = x_fields[i + 1].start() if i + 1 < len(x_fields) else len(data)
+            # The tune header ends with the first K: field
+            if key_field := RE_BYTES_KEY_FIELD.search(data, match.end(), end):
+                header_end = key_field.end()
+            else:
+                header_end = end
+
+            titles = tuple(
+                remove_comment(encode_accent_and_ligature(decode_abc(m.group()[2:]))).strip()
+                for m in RE_BYTES_TITLE_FIELD.finditer(data, match.end(), header_end)
+            )
+            number = decode_abc(match.group()[2:]).split('%', maxsplit=1)[0].strip()
+            entry = TuneEntry(number=number, titles=titles, start=match.start(),
+                              body=match.end(), header_end=header_end, end=end)
+            self.entries.append(entry)
+
+            # The first tune wins if the reference number or title is not unique
+            self._numbers.setdefault(number, entry)
+            for title in titles:
+                self._titles.setdefault(title, entry)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[TuneEntry]:
+        return iter(self.entries)
+
+    def __enter__(self) -> 'TuneBookIndex':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the memory map of the tune book file.
+        """
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    @property
+    def file_header(self) -> tuple[FileHeader, dict[str, str]]:
+        """
+        Returns the processed file header and the macros defined in the file header.
+        """
+        if self._file_header is None:
+            self._file_header = translate_file_header(
+                decode_abc(self.data[:self.file_header_end]))
+        return self._file_header
+
+    def find(self, number: str | int | None = None, title: str | None = None) -> TuneEntry:
+        """
+        Find a tune by its reference number or its title.
+
+        Raises:
+            ABCException: If there is no such tune in the tune book.
+        """
+        if number is not None:
+            entry = self._numbers.get(str(number).strip(), None)
+        elif title is not None:
+            entry = self._titles.get(title.strip(), None)
+        else:
+            raise ABCException("Find a tune by reference number or title.")
+
+        if entry is None:
+            raise ABCException(f"No tune with {'number' if number is not None else 'title'} "
+                               f"'{number if number is not None else title}' in '{self.path}'.")
+        return entry
+
+    def tune_source(self, entry: TuneEntry) -> str:
+        """
+        Returns the abc source of a tune, without the leading X: field.
+        """
+        return decode_abc(self.data[entry.body:entry.end])
+
+    def abc_ref_number(self, entry: TuneEntry) -> str:
+        """
+        Returns the X: field of a tune.
+        """
+        x_field = decode_abc(self.data[entry.start:entry.body])
+        return x_field.split('%', maxsplit=1)[0].strip()
+
+    def tune_header(self, entry: TuneEntry) -> TuneHeader:
+        """
+        Process only the tune header of a tune, the tune body is not read at all.
+        """
+        file_header, macros = self.file_header
+        return translate_tune_header(decode_abc(self.data[entry.body:entry.header_end]),
+                                     self.abc_ref_number(entry), file_header, macros)
+
+    def translate(self, number: str | int | None = None,
+                  title: str | None = None) -> stream.Score:
+        """
+        Translate a single tune, looked up by its reference number or its title.
+        """
+        entry = self.find(number=number, title=title)
+        file_header, macros = self.file_header
+        return translate_tune(self.tune_source(entry), self.abc_ref_number(entry),
+                              file_header, macros, source=f"{self.path}")
+
+
+class CatalogEntry(NamedTuple):
+    """
+    A tune in the :class:`~TuneCatalog`.
+
+    The byte offsets refer to the tune book file, see :class:`~TuneEntry`.
+    """
+    path: str
+    number: str
+    title: str | None
+    composer: str | None
+    key: str | None
+    meter: str | None
+    rhythm: str | None
+    start: int
+    end: int
+
+
+def key_name(key_signature: key.KeySignature | None) -> str | None:
+    """
+    Returns a short name of a key signature for the catalog. A key signature
+    without tonic and mode is named by its altered pitches.
+
+    >>> key_name(key.Key('G', 'mixolydian'))
+    'G mixolydian'
+    >>> ks = key.KeySignature(sharps=None)
+    >>> ks.alteredPitches = ['F#', 'C#']
+    >>> key_name(ks)
+    'F# C#'
+    >>> key_name(key.KeySignature(sharps=None))
+    'none'
+    """
+    if key_signature is None:
+        return None
+    if isinstance(key_signature, key.Key):
+        return f"{key_signature.tonic.name} {key_signature.mode}"
+    return ' '.join(p.name for p in key_signature.alteredPitches) or 'none'
+
+
+class TuneCatalog:
+    """
+    A persistent catalog of the tune headers of abc tune book files.
+
+    Only the tune headers (up to the K: field) are processed, the tune bodies are
+    never translated. The reference number, title, composer, key, meter and rhythm
+    of each tune are stored with the byte offsets of the tune in an SQLite
+    database. A tune book is indexed again only if its modification time and
+    the hash of its content have changed.
+
+    Args:
+        db_path (Path | str): The path of the SQLite database, ':memory:' for a
+        catalog that is not persistent.
+
+    Examples:
+
+    >>> catalog = TuneCatalog(':memory:')
+    >>> catalog.update(Path('../abc/avemaria.abc'))
+    True
+    >>> catalog.update(Path('../abc/avemaria.abc'))
+    False
+    >>> entry, = catalog.query(composer='Franz Schubert%')
+    >>> entry.title, entry.key, entry.meter
+    ("Ave Maria (Ellen's Gesang III) - Page 1", 'B- major', '4/4')
+    >>> catalog.close()
+    """
+
+    FIELDS = ('path', 'number', 'title', 'composer', 'key', 'meter', 'rhythm')
+
+    def __init__(self, db_path: Path | str):
+        self.connection = sqlite3.connect(str(db_path))
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS books (
+                    path TEXT PRIMARY KEY, mtime INTEGER, hash TEXT);
+                CREATE TABLE IF NOT EXISTS tunes (
+                    path TEXT, number TEXT, title TEXT, composer TEXT, key TEXT,
+                    meter TEXT, rhythm TEXT, start INTEGER, end INTEGER);
+                CREATE INDEX IF NOT EXISTS tunes_path ON tunes (path);
+                CREATE INDEX IF NOT EXISTS tunes_number ON tunes (number);
+                CREATE INDEX IF NOT EXISTS tunes_title ON tunes (title COLLATE NOCASE);
+                CREATE INDEX IF NOT EXISTS tunes_composer ON tunes (composer COLLATE NOCASE);
+                CREATE INDEX IF NOT EXISTS tunes_key ON tunes (key);
+                CREATE INDEX IF NOT EXISTS tunes_meter ON tunes (meter);
+                CREATE INDEX IF NOT EXISTS tunes_rhythm ON tunes (rhythm COLLATE NOCASE);
+            """)
+
+    def close(self):
+        """
+        Close the catalog database.
+        """
+        self.connection.close()
+
+    def update(self, path: Path) -> bool:
+        """
+        Index a tune book file, if it is not in the catalog or if it has changed.
+
+        Returns:
+            bool: True if the tune book has been indexed.
+        """
+        book = str(path.resolve())
+        mtime = path.stat().st_mtime_ns
+        row = self.connection.execute('SELECT mtime, hash FROM books WHERE path = ?',
+                                      (book,)).fetchone()
+        if row and row[0] == mtime:
+            return False
+
+        with TuneBookIndex(path) as index:
+            content_hash = hashlib.sha256(index.data).hexdigest()
+            with self.connection:
+                if row and row[1] == content_hash:
+                    # Touched, but not modified
+                    self.connection.execute('UPDATE books SET mtime = ? WHERE path = ?',
+                                            (mtime, book))
+                    return False
+
+                self.connection.execute('DELETE FROM tunes WHERE path = ?', (book,))
+                self.connection.executemany(
+                    'INSERT INTO tunes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (self._catalog_entry(book, index, entry) for entry in index))
+                self.connection.execute('INSERT OR REPLACE INTO books VALUES (?, ?, ?)',
+                                        (book, mtime, content_hash))
+        return True
+
+    @staticmethod
+    def _catalog_entry(book: str, index: TuneBookIndex, entry: TuneEntry) -> CatalogEntry:
+        tune_header = index.tune_header(entry)
+        md = tune_header.metadata
+        rhythm = md.getCustom('rhythm')
+        ts = tune_header.time_signature
+        return CatalogEntry(path=book, number=entry.number, title=md.title,
+                            composer=', '.join(md.composers) or None,
+                            key=key_name(tune_header.key_signature),
+                            meter=ts.ratioString if ts else None,
+                            rhythm=', '.join(str(r) for r in rhythm) if rhythm else None,
+                            start=entry.start, end=entry.end)
+
+    def query(self, **fields: str) -> list[CatalogEntry]:
+        """
+        Find tunes by the fields path, number, title, composer, key, meter and rhythm.
+
+        The values are SQL LIKE patterns, the character '%' matches any sequence
+        of characters, and the comparison ignores the case of ASCII characters.
+        """
+        if unknown := set(fields) - set(TuneCatalog.FIELDS):
+            raise ABCException(f"Unknown catalog fields: {', '.join(sorted(unknown))}")
+
+        where = ' AND '.join(f'{field} LIKE ?' for field in fields) or '1'
+        rows = self.connection.execute(f'SELECT * FROM tunes WHERE {where} ORDER BY path, start',
+                                       tuple(fields.values()))
+        return [CatalogEntry(*row) for row in rows]
+
+
+if __name__ == '__main__':
+    import doctest
+
+    doctest.testmod(optionflags=doctest.NORMALIZE_WHITESPACE)
@@ -1,4 +1,14 @@
+import asyncio
+import bz2
+import gzip
+import io
+import lzma
+import os
+import pickle
+import random
+import time
 import unittest
+import zipfile
 from unittest.mock import patch
 from io import StringIO
 from typing import NamedTuple
@@ -6,8 +16,24 @@ from music21 import duration, spanner, dynamics, common, tie, instrument, clef
 from music21 import expressions, articulations, harmony, style, environment
 from music21 import meter, key, pitch, stream, metadata, bar, tempo, layout
 from music21 import note, chord, repeat, base
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from itertools import chain
-from abc_to_music21 import abc_translator, tokenize, testtunes
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from abc_to_music21 import abc_translator, iter_abc_tunes, read_abc_headers, tokenize, testtunes
+from abc_to_music21 import Field, freeze_score, thaw_score
+from abc_to_music21 import translate_file_header, translate_fragment, translate_tune
+from abc_to_music21 import translate_tune_batch
+from abc_to_music21.aio import abc_translate_async, aiter_abc_tunes
+from abc_to_music21.cache import CacheInfo, MemoryScoreCache, ScoreCache, translate_incremental
+from abc_to_music21.parser import ABCException, ABC2M21_CONFIG, FileHeader, TuneHeader, TuneBody
+from abc_to_music21.tokens import TOKEN_RE, TOKEN_TYPE_NAMES, Token, scan_tokens, tokenize_table
+from abc_to_music21.tokens import TOKEN_FIRST_CHARACTERS, TOKEN_SPEC
+from abc_to_music21.tokens import ChordToken, GraceToken, NoteComponents, NoteToken, decode_note
+from abc_to_music21.tokens import FREE_TEXT_TOKEN_TYPES, remove_comment, tokenize_cached
+from abc_to_music21.tokens import IncrementalTokenizer, TokenSpan, tokenize_stream
+from abc_to_music21.tokens import TOKENIZE_CHUNK_SIZE, tokenize_bytes, tokenize_file
+from abc_to_music21.tunebook import TuneBookIndex, TuneCatalog, decode_abc
 
 a = environment.Environment()
 a['debug'] = True
@@ -749,6 +775,617 @@ class TestFiles(unittest.TestCase):
             self.assertEqual(n.name, name)
             self.assertEqual(n.lyric, lyric)
 
+    def test_parallel_tune_book(self):
+        opus = abc_translator(testtunes.tunebook_with_macros)
+        parallel_opus = abc_translator(testtunes.tunebook_with_macros, workers=2)
+
+        self.assertIsInstance(parallel_opus, stream.Opus)
+        self.assertEqual([score.id for score in opus.scores],
+                         [score.id for score in parallel_opus.scores])
+        for score, parallel_score in zip(opus.scores, parallel_opus.scores):
+            self.assertEqual(score.metadata.title, parallel_score.metadata.title)
+            self.assertEqual([n.fullName for n in score.flatten().notes],
+                             [n.fullName for n in parallel_score.flatten().notes])
+
+    def test_translate_tune_batch(self):
+        file_header_src, _, tunes_src = testtunes.tunebook_with_macros.partition('X: bla\n')
+        tunes = ['X: bla\n' + tunes_src.split('X: 2\n')[0]] + \
+                [tune_src for tune_src in tunes_src.split('X: 2\n')[1:]]
+        opus = abc_translator(testtunes.tunebook_with_macros)
+        file_header, macros = translate_file_header(file_header_src)
+
+        for scores in (translate_tune_batch(tunes, file_header, macros),
+                       translate_tune_batch(iter(tunes), file_header_src, workers=2)):
+            self.assertEqual(['X: bla', 'X:2', 'X:3'], [score.id for score in scores])
+            for score, batch_score in zip(opus.scores, scores):
+                self.assertEqual(score.metadata.title, batch_score.metadata.title)
+                self.assertEqual([n.fullName for n in score.flatten().notes],
+                                 [n.fullName for n in batch_score.flatten().notes])
+
+    def test_transposing_macros(self):
+        abc = """
+X:1
+L:1/8
+m: ~n2 = (3o/n/m/n/
+m: ~C = {g}C
+K:C
+~G2 ~c2 ~C ~B,2|
+"""
+        notes = abc_translator(abc).flatten().notes
+        self.assertEqual(['A4', 'G4', 'F4', 'G4', 'D5', 'C5', 'B4', 'C5', 'G5', 'C4',
+                          'C4', 'B3', 'A3', 'B3'], [n.nameWithOctave for n in notes])
+
+    def test_freeze_score(self):
+        score = abc_translator(testtunes.tunebook_with_macros).scores[0]
+        thawed_score = thaw_score(freeze_score(score))
+
+        # The offsets and sites are keyed by the ids of the thawed objects
+        for s in thawed_score.recurse(streamsOnly=True, includeSelf=True):
+            for element in s:
+                self.assertIs(element, s._offsetDict[id(element)][1])
+                self.assertIn(s, element.sites)
+        self.assertEqual([(n.fullName, n.offset) for n in score.flatten().notes],
+                         [(n.fullName, n.offset) for n in thawed_score.flatten().notes])
+
+    def test_compressed_tune_books(self):
+        data = testtunes.tunebook_with_macros.encode()
+        opus = abc_translator(testtunes.tunebook_with_macros)
+        expected = [[n.fullName for n in score.flatten().notes] for score in opus.scores]
+
+        with TemporaryDirectory() as tmp_dir:
+            paths = []
+            for suffix, compress in (('gz', gzip.compress), ('bz2', bz2.compress),
+                                     ('xz', lzma.compress)):
+                paths.append(Path(tmp_dir) / f'tunebook.abc.{suffix}')
+                paths[-1].write_bytes(compress(data))
+
+            zip_path = Path(tmp_dir) / 'tunebooks.zip'
+            with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr('book1.abc', data)
+                archive.writestr('book2.abc', data)
+                archive.writestr('README', 'no abc')
+
+            for src in paths + [zipfile.Path(zip_path, 'book2.abc'), io.BytesIO(data)]:
+                tunes = list(iter_abc_tunes(src))
+                self.assertEqual(['bla', '2', '2'], [number for number, _ in tunes])
+                self.assertEqual(expected, [[n.fullName for n in score.flatten().notes]
+                                            for _, score in tunes])
+            self.assertEqual(3, len(list(read_abc_headers(io.BytesIO(gzip.compress(data))))))
+
+            score_ids = [score.id for score in abc_translator(paths[0]).scores]
+            self.assertEqual(f"X: bla (file='{paths[0]}')", score_ids[0])
+
+            zip_opus = abc_translator(zip_path)
+            self.assertEqual(6, len(zip_opus.scores))
+            self.assertEqual(f"X: 2 (file='{zip_path}/book2.abc')", zip_opus.scores[-1].id)
+
+            with self.assertRaises(ABCException):
+                abc_translator(123)
+
+    def test_translate_fragment(self):
+        for fragment in ('[M:3/4] B c | d e f | g a b |', 'A B c d | e f |\nw: la la la la la la\n',
+                         '|: ABcd :|[1 efga :|[2 gfed |]', 'abc$ def | gab |'):
+            part = translate_fragment(fragment)
+            score = TuneBody(tune_header=TuneHeader()).process(tokenize(fragment + '\n'))
+            self.assertIsInstance(part, stream.Part)
+            self.assertEqual(len(score.parts), 1)
+            for measure, score_measure in zip(part.getElementsByClass(stream.Measure),
+                                              score.parts[0].getElementsByClass(stream.Measure)):
+                self.assertEqual(score_measure.number, measure.number)
+                self.assertEqual(score_measure.paddingLeft, measure.paddingLeft)
+                self.assertEqual(score_measure.leftBarline, measure.leftBarline)
+                self.assertEqual(score_measure.rightBarline, measure.rightBarline)
+                self.assertEqual([(n.fullName, n.offset, [ly.text for ly in n.lyrics])
+                                  for n in score_measure.recurse().notesAndRests],
+                                 [(n.fullName, n.offset, [ly.text for ly in n.lyrics])
+                                  for n in measure.recurse().notesAndRests])
+                self.assertEqual(len(score_measure.getElementsByClass(layout.SystemLayout)),
+                                 len(measure.getElementsByClass(layout.SystemLayout)))
+
+        # Multiple voices are combined into a score
+        self.assertIsInstance(translate_fragment('V:1\nABC|\nV:2\nCDE|'), stream.Score)
+
+    def test_scan_tokens(self):
+        abc_files = (Path(__file__).parent.parent / 'abc').glob('*.abc')
+        tunes = [v for v in vars(testtunes).values() if isinstance(v, str)]
+        self.assertEqual(list(TOKEN_FIRST_CHARACTERS), [name for name, _ in TOKEN_SPEC])
+        for src in chain((f.read_text() for f in abc_files), tunes, ['', ' ', 'X:1\n\n\n', '%%']):
+            self.assertEqual([(m.lastgroup, m.span()) for m in scan_tokens(src)],
+                             [(m.lastgroup, m.span()) for m in TOKEN_RE.finditer(src)])
+            for m in TOKEN_RE.finditer(src):
+                if TOKEN_FIRST_CHARACTERS[m.lastgroup] is not None:
+                    self.assertIn(m.group()[:1], TOKEN_FIRST_CHARACTERS[m.lastgroup])
+
+    def test_scan_free_text(self):
+        # Skipping the free text after an empty line keeps its fields and directives
+        free_text = ['notes\n[V: S1] [K: F treble]\nT:x\n', 'a "b\nc" K:G\nK:A\n',
+                     'a "" b\nT:x\n', '!"! "a\nK:G\n', '{a\nK:G}\nK:A\n',
+                     'The "end" %%\n%%score 1\nW:words']
+        abc_files = (Path(__file__).parent.parent / 'abc').glob('*.abc')
+        for src in chain((f.read_text() for f in abc_files), ('A\n\n' + t for t in free_text)):
+            self.assertEqual([(m.lastgroup, m.span()) for m in scan_tokens(src, True)
+                              if m.lastgroup in FREE_TEXT_TOKEN_TYPES],
+                             [(m.lastgroup, m.span()) for m in scan_tokens(src)
+                              if m.lastgroup in FREE_TEXT_TOKEN_TYPES])
+
+    def test_tokenize_table(self):
+        abc_files = (Path(__file__).parent.parent / 'abc').glob('*.abc')
+        tunes = [v for v in vars(testtunes).values() if isinstance(v, str)]
+        continued = ['T:a\\\nT:b\n+:c\nK:G\nA', 'w:x\\\n%%score 1\nw:y\n\nfree text\nK:A\n']
+        for src in chain((f.read_text() for f in abc_files), tunes, continued):
+            for version in ((1, 6, 0), (2, 0, 0)):
+                table = tokenize_table(src, version)
+                self.assertEqual([(type(t), t.type, t.src, t.pos) for t in table],
+                                 [(type(t), t.type, t.src, t.pos) for t in tokenize(src, version)])
+
+        table = tokenize_table('T:a\\\nT:b\nK:G\nA2 B')
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table.text(0), 'T:ab')
+        self.assertEqual((table.type(3), table.text(3), table.starts[3]), ('note', 'B', 16))
+
+        # A table can be processed like a token iterator
+        score = TuneBody(tune_header=TuneHeader()).process(tokenize_table('CDE|FGA|\n'))
+        self.assertEqual(len(score.parts[0].getElementsByClass(stream.Measure)), 2)
+
+    def test_abc_token_dispatch(self):
+        class Parser(TuneBody):
+            def abc_dispatch_test(self, token):
+                return token.src
+
+        parser = Parser(tune_header=TuneHeader())
+        parser.abc_token(Token('note', 'C'))
+        # A token type interned after the dispatch table was built
+        token = Token('dispatch_test', 'ok')
+        self.assertEqual(TOKEN_TYPE_NAMES[token.code], 'dispatch_test')
+        self.assertEqual(parser.abc_token(token), 'ok')
+        self.assertIsNot(Parser.abc_methods, TuneBody.abc_methods)
+
+        copied = pickle.loads(pickle.dumps(token))
+        self.assertEqual((copied.type, copied.src, copied.code), (token.type, token.src, token.code))
+
+    def test_tokenize_cached(self):
+        tokenize_cached.cache_clear()
+        score = abc_translator('X:1\nU:T=!trill!\nK:C\n[CEG] [CEG]2 {ga}[CEG] | T{ga}c4 |]')
+        self.assertEqual(len(score.recurse().getElementsByClass(chord.Chord)), 3)
+        info = tokenize_cached.cache_info()
+        self.assertEqual((info.hits, info.misses), (3, 3))
+
+        token = tokenize_cached('CEG')[0]
+        with self.assertRaises(AttributeError):
+            token.src = 'D'
+        self.assertEqual(tokenize_cached('CEG')[0].src, 'C')
+
+    def test_structured_tokens(self):
+        chord_token, grace_token, note_token = tokenize('[C_E,G]3/2- {/ga}^^f\'\'/-')
+        self.assertIsInstance(chord_token, ChordToken)
+        self.assertEqual([n.components for n in chord_token.notes],
+                         [NoteComponents('', 'C', 0, (1, 1), False),
+                          NoteComponents('_', 'E', -1, (1, 1), False),
+                          NoteComponents('', 'G', 0, (1, 1), False)])
+        self.assertEqual((chord_token.length, chord_token.tie), ((3, 2), True))
+        self.assertIsInstance(grace_token, GraceToken)
+        self.assertEqual([n.src for n in grace_token.notes], ['g', 'a'])
+        self.assertTrue(grace_token.slash)
+        self.assertIsInstance(note_token, NoteToken)
+        self.assertEqual(note_token.components, NoteComponents('^^', 'f', 2, (1, 2), True))
+
+        # The tokenizer decodes the notes like decode_note
+        for src in ["C2'-", 'C2 -', "c,,//", 'D3/4/', '=B1/2/3']:
+            token, = tokenize(src)
+            self.assertEqual(token.components, decode_note(src))
+
+    def test_field_tokens(self):
+        field = Field('key', 'K: G mix % comment')
+        self.assertFalse(hasattr(field, '__dict__'))
+        self.assertEqual((field.tag, field.data), ('K', 'G mix % comment'))
+        self.assertEqual((Field('voice', '[V: S1]').tag, Field('voice', '[V: S1]').data),
+                         ('V', 'S1'))
+        with self.assertRaises(AttributeError):
+            field.data = 'A'
+
+        # Continued fields get the tag and data of the joined text
+        for version in ((1, 6, 0), (2, 0, 0)):
+            field, = tokenize('T:a b\n+:c', version)
+            self.assertEqual((field.tag, field.data, field.src), ('T', 'a b c', 'T:a b c'))
+            self.assertEqual(pickle.loads(pickle.dumps(field)).data, 'a b c')
+
+    def test_tokenize_stream(self):
+        abc_files = (Path(__file__).parent.parent / 'abc').glob('*.abc')
+        tunes = [v for v in vars(testtunes).values() if isinstance(v, str)]
+        multiline = ['T:a\\\nT:b\n+:c\nK:G\nA\\\n\n  \nB "open\n\nquote" {g\na}[C\nE]c\n\n-d\n'
+                     '\nfree\n%%text\n']
+        for src in chain((f.read_text() for f in abc_files), tunes, multiline):
+            for version in ((1, 6, 0), (2, 0, 0)):
+                expected = [(type(t), t.type, t.src, t.pos) for t in tokenize(src, version)]
+                for chunk_size in (1, 7, 4096):
+                    stream = io.StringIO(src)
+                    self.assertEqual([(type(t), t.type, t.src, t.pos)
+                                      for t in tokenize_stream(stream, version, chunk_size)],
+                                     expected)
+
+        # The stream is read as the tokens are requested
+        src = 'X:1\nK:C\n' + 'CDEF GABc|\n' * 1000
+        stream = io.StringIO(src)
+        tokens = tokenize_stream(stream, chunk_size=100)
+        self.assertEqual(next(tokens).src, 'X:1')
+        self.assertLess(stream.tell(), 1000)
+
+    def test_tokenize_bytes(self):
+        abc_files = sorted((Path(__file__).parent.parent / 'abc').glob('*.abc'))
+        tunes = [v.encode() for v in vars(testtunes).values() if isinstance(v, str)]
+        special = ['T:Caf\\\'e\\\r\nT:b\r\n+:c\r\nK:G\rA\\ % x\nB "é\\\n" é\u00a0D\n'.encode()]
+        # White space outside of ASCII, e.g. a no-break space
+        spaces = [c for c in map(chr, range(0x3001)) if c.isspace() and not c.encode().isspace()]
+        special += [f'K:G\nA{c}-A|!trill{c}x!B\\\nc\n'.encode() for c in spaces]
+        for data in chain((f.read_bytes() for f in abc_files), tunes, special):
+            for version in ((1, 6, 0), (2, 0, 0)):
+                self.assertEqual([(type(t), t.type, t.src) for t in tokenize_bytes(data, version)],
+                                 [(type(t), t.type, t.src)
+                                  for t in tokenize(decode_abc(data), version)])
+
+        # The positions are byte offsets
+        src = 'T:Café\nK:G\nA B\\\nc'
+        tokens = list(tokenize_bytes(src.encode(), (2, 0, 0)))
+        self.assertEqual([src.encode()[t.pos:t.pos + 1] for t in tokens[2:]], [b'A', b'B', b'c'])
+        tokens = list(tokenize_bytes((src + '\u00a0d').encode(), (2, 0, 0)))
+        self.assertEqual([src.encode()[t.pos:t.pos + 1] for t in tokens[2:-1]], [b'A', b'B', b'c'])
+        self.assertEqual(tokens[-1].pos, len(src.encode()) + 2)
+        data = src.replace('\n', '\r\n').encode()
+        tokens = list(tokenize_bytes(data, (2, 0, 0)))
+        self.assertEqual([data[t.pos:t.pos + 1] for t in tokens[1:]], [b'K', b'A', b'B', b'c'])
+
+        # The data is decoded chunk by chunk, a chunk may end inside a character or a '\r\n'
+        for tail in ('é' * (TOKENIZE_CHUNK_SIZE // 2), '\r\n' * (TOKENIZE_CHUNK_SIZE // 2)):
+            src = f'K:G\r\nA {tail}B\r\nc\\\r\nd\u00a0e'
+            data = src.encode()
+            for version in ((1, 6, 0), (2, 0, 0)):
+                tokens = list(tokenize_bytes(data, version))
+                self.assertEqual([(t.type, t.src) for t in tokens],
+                                 [(t.type, t.src) for t in tokenize(decode_abc(data), version)])
+                self.assertEqual([data[t.pos:t.pos + len(t.src.encode())].decode() for t in tokens
+                                  if t.type in ('note', 'unknown_token')],
+                                 [t.src for t in tokens if t.type in ('note', 'unknown_token')])
+
+        # A memory-mapped file
+        self.assertEqual([t.src for t in tokenize_file(abc_files[0])],
+                         [t.src for t in tokenize(abc_files[0].read_text())])
+        with TemporaryDirectory() as directory:
+            empty = Path(directory) / 'empty.abc'
+            empty.touch()
+            self.assertEqual(list(tokenize_file(empty)), [])
+
+    def test_abc_20_line_continue_positions(self):
+        src = 'K:G\nA B\\ % joined\nc d\\\n\n e |\n'
+        tokens = [t for t in tokenize(src, abc_version=(2, 0, 0)) if t.type == 'note']
+        self.assertEqual([t.src for t in tokens], ['A', 'B', 'c', 'd', 'e'])
+        # The positions are positions in the abc source with the line continuations
+        self.assertEqual([src[t.pos] for t in tokens], ['A', 'B', 'c', 'd', 'e'])
+        self.assertEqual([t.pos for t in tokenize_table(src, (2, 0, 0)) if t.type == 'note'],
+                         [t.pos for t in tokens])
+
+    def test_pathological_inputs(self):
+        # Inputs which made the token patterns backtrack, each has to be lexed within the budget
+        n = 20000
+        corpus = {
+            'spaces': 'K:G\n' + ' ' * n + 'a',
+            'spaces after a note': 'K:G\n' + 'A' + ' ' * n,
+            'backslashes': 'K:G\n' + '\\ ' * n + 'a',
+            'accidentals': 'K:G\n' + '^' * n,
+            'grace note openers': 'K:G\n' + '{' * n,
+            'chord openers': 'K:G\n' + '[' * n + ':',
+            'inline field openers': 'K:G\n' + '[K:' * n,
+            'field line quotes': 'K:G\nT:' + '"a' * n + '%\n',
+        }
+        budget = 2.0
+        for name, src in corpus.items():
+            for version in ((1, 6, 0), (2, 0, 0)):
+                start = time.perf_counter()
+                list(tokenize(src, version))
+                self.assertLess(time.perf_counter() - start, budget, name)
+
+        for line in ('T:' + '"a' * n + '%', 'T:' + ' ' * n + '"', 'T:' + '"%' * n):
+            start = time.perf_counter()
+            remove_comment(line)
+            self.assertLess(time.perf_counter() - start, budget)
+
+    def test_incremental_tokenizer(self):
+        def spans(text):
+            return [TokenSpan(m.lastgroup, m.start(), m.end()) for m in scan_tokens(text)]
+
+        def check(tokenizer, change):
+            expected = spans(tokenizer.text)
+            self.assertEqual(list(tokenizer), expected)
+            self.assertEqual(change.spans,
+                             [s for s in expected if change.start <= s.start < change.end])
+
+        tokenizer = IncrementalTokenizer('K:G\nA\n')
+        change = tokenizer.edit(len(tokenizer.text), 0, 'abc|\n')
+        # The note A of the previous line may be tied to the new line
+        self.assertEqual((change.start, change.end), (4, 11))
+        self.assertEqual([s.type for s in change.spans],
+                         ['note', 'newline', 'note', 'note', 'note', 'barline', 'newline'])
+
+        # Edits changing the tokens of the lines before the edit
+        tokenizer = IncrementalTokenizer('K:G\nA\n  B\n"C D\n{E\nF|\n')
+        edits = [(7, 0, '-'), (19, 0, '"'), (2, 1, 'D\n[K:A'), (0, 0, '['), (25, 0, '"')]
+        for offset, removed, inserted in edits:
+            check(tokenizer, tokenizer.edit(offset, removed, inserted))
+
+        # Closing a quote lexes the text from the quote again
+        change = tokenizer.edit(len(tokenizer.text), 0, 'G"\n')
+        self.assertEqual(change.spans[0].type, 'chord_symbol')
+
+        src = (Path(__file__).parent.parent / 'abc' / 'bwv1052a.abc').read_text()
+        tokenizer = IncrementalTokenizer(src[:4000])
+        pieces = ['"', '{', '}', '[', ']', ':', '-', ' ', '\n', 'A', '^', '\\', '%', 'K:G\n', '+']
+        rnd = random.Random(0)
+        for _ in range(200):
+            offset = rnd.randint(0, len(tokenizer.text))
+            removed = rnd.randint(0, min(3, len(tokenizer.text) - offset))
+            change = tokenizer.edit(offset, removed, ''.join(rnd.choices(pieces, k=2)))
+            check(tokenizer, change)
+
+        # Only the lines around an edit are lexed again
+        tokenizer = IncrementalTokenizer(src)
+        for offset in range(len(src) // 2, len(src) // 2 + 100):
+            self.assertLess(len(tokenizer.edit(offset, 0, 'A').spans), 100)
+            self.assertLess(len(tokenizer.edit(offset, 1, '').spans), 100)
+        self.assertEqual(tokenizer.text, src)
+
+        with self.assertRaises(ValueError):
+            tokenizer.edit(len(tokenizer.text), 1, '')
+
+    def test_iter_abc_tunes(self):
+        opus = abc_translator(testtunes.tunebook_with_macros)
+        tunes = list(iter_abc_tunes(testtunes.tunebook_with_macros))
+
+        self.assertEqual(['bla', '2', '2'], [number for number, _ in tunes])
+        for score, (_, tune_score) in zip(opus.scores, tunes):
+            self.assertEqual(score.id, tune_score.id)
+            self.assertEqual([n.fullName for n in score.flatten().notes],
+                             [n.fullName for n in tune_score.flatten().notes])
+
+        tune_path = Path(__file__).parent.parent / 'abc' / 'avemaria.abc'
+        (number, score), = iter_abc_tunes(tune_path)
+        self.assertEqual('1', number)
+        self.assertEqual(abc_translator(tune_path).id, score.id)
+
+    def test_tune_book_index(self):
+        opus = abc_translator(testtunes.tunebook_with_macros)
+
+        with TemporaryDirectory() as tmp_dir:
+            tune_path = Path(tmp_dir) / 'tunebook.abc'
+            tune_path.write_text(testtunes.tunebook_with_macros)
+
+            with TuneBookIndex(tune_path) as index:
+                self.assertEqual(['bla', '2', '2'], [entry.number for entry in index])
+                self.assertEqual(('Macro tune 2',), index.find(number=2).titles)
+
+                score = index.translate(title='Macro tune 2')
+                self.assertEqual(f"X: 2 (file='{tune_path}')", score.id)
+                self.assertEqual([n.fullName for n in opus.scores[1].flatten().notes],
+                                 [n.fullName for n in score.flatten().notes])
+
+                score = index.translate(number='bla')
+                self.assertEqual([n.fullName for n in opus.scores[0].flatten().notes],
+                                 [n.fullName for n in score.flatten().notes])
+
+                with self.assertRaises(ABCException):
+                    index.translate(number=3)
+
+    def test_tune_catalog(self):
+        with TemporaryDirectory() as tmp_dir:
+            tune_path = Path(tmp_dir) / 'tunebook.abc'
+            tune_path.write_text(testtunes.tunebook_with_macros)
+            catalog = TuneCatalog(Path(tmp_dir) / 'catalog.sqlite')
+
+            self.assertTrue(catalog.update(tune_path))
+            self.assertEqual(3, len(catalog.query()))
+            entry, = catalog.query(title='macro tune 2')
+            self.assertEqual('2', entry.number)
+            self.assertEqual('none', entry.key)
+            with TuneBookIndex(tune_path) as index:
+                self.assertEqual(index.find(number=2).start, entry.start)
+
+            # A new modification time, but the same content
+            os.utime(tune_path, ns=(0, 0))
+            self.assertFalse(catalog.update(tune_path))
+
+            tune_path.write_text(testtunes.tunebook_with_macros.replace('K:\n', 'M:6/8\nK:G\n'))
+            os.utime(tune_path, ns=(1, 1))
+            self.assertTrue(catalog.update(tune_path))
+            self.assertEqual(3, len(catalog.query(key='G major', meter='6/8')))
+            catalog.close()
+
+            # The catalog is persistent
+            catalog = TuneCatalog(Path(tmp_dir) / 'catalog.sqlite')
+            self.assertFalse(catalog.update(tune_path))
+            self.assertEqual(['bla'], [e.number for e in catalog.query(title='Macro tune 1')])
+            catalog.close()
+
+    def test_read_abc_headers(self):
+        headers = list(read_abc_headers(testtunes.tunebook_with_macros))
+        self.assertEqual(['bla', '2', '2'], [info.number for info in headers])
+        self.assertEqual(['Macro tune 1', 'Macro tune 2', None],
+                         [info.metadata.title for info in headers])
+
+        tune_path = Path(__file__).parent.parent / 'abc' / 'avemaria.abc'
+        info, = read_abc_headers(tune_path)
+        score = abc_translator(tune_path)
+        self.assertEqual(score.metadata.title, info.metadata.title)
+        self.assertEqual(score.metadata.composers, info.metadata.composers)
+        self.assertEqual(str(score.flatten().getElementsByClass(key.KeySignature).first()),
+                         str(info.key_signature))
+        self.assertEqual(4, info.time_signature.numerator)
+
+    def test_score_cache(self):
+        opus = abc_translator(testtunes.tunebook_with_macros)
+
+        with TemporaryDirectory() as cache_dir:
+            cache = ScoreCache(cache_dir)
+            abc_translator(testtunes.tunebook_with_macros, cache=cache)
+            self.assertEqual((0, 3), (cache.hits, cache.misses))
+
+            cached_opus = abc_translator(testtunes.tunebook_with_macros, workers=2, cache=cache)
+            self.assertEqual((3, 3), (cache.hits, cache.misses))
+            self.assertEqual([score.id for score in opus.scores],
+                             [score.id for score in cached_opus.scores])
+            for score, cached_score in zip(opus.scores, cached_opus.scores):
+                self.assertEqual([n.fullName for n in score.flatten().notes],
+                                 [n.fullName for n in cached_score.flatten().notes])
+
+            # A different configuration or file header is a cache miss
+            with patch.dict(ABC2M21_CONFIG, {'simplifiedComplexMeter': True}):
+                abc_translator(testtunes.tunebook_with_macros, cache=cache)
+            abc_translator('C:Bach\n' + testtunes.tunebook_with_macros, cache=cache)
+            self.assertEqual((3, 9), (cache.hits, cache.misses))
+
+            # Storing a score again replaces its file
+            size = cache.size
+            key = cache.key('K:G\nGAB', 'X:1', translate_file_header('')[0])
+            cache.put(key, opus.scores[0])
+            cache.put(key, opus.scores[0])
+            self.assertEqual(sum(path.stat().st_size for path in Path(cache_dir).iterdir()),
+                             cache.size)
+            self.assertGreater(cache.size, size)
+            cache.discard(key)
+            self.assertEqual(size, cache.size)
+
+            # The state of a file header without abc source is unknown
+            with self.assertRaises(ABCException):
+                translate_tune('K:G\nGAB', 'X:1', FileHeader(), cache=cache)
+
+            # Evict the least recently used scores
+            cache.max_size = cache.size // 2
+            cache.evict()
+            self.assertLessEqual(cache.size, cache.max_size)
+            self.assertLess(len(list(Path(cache_dir).iterdir())), 9)
+
+            cache.clear()
+            self.assertEqual([], list(Path(cache_dir).iterdir()))
+
+            # Changing only a macro of the file header is a cache miss
+            tune_book = 'm: ~G = GAB\n\nX:1\nK:C\n~G2|\n'
+            for macro in ('GAB', 'cde'):
+                score = abc_translator(tune_book.replace('GAB', macro), cache=cache)
+                self.assertEqual(list(macro.upper()),
+                                 [n.step for n in score.flatten().notes])
+            self.assertEqual((0, 2), (cache.hits, cache.misses))
+
+            # Also for macros passed with a processed file header
+            file_header, _ = translate_file_header('C:Trad.\n')
+            for macro in ('GAB', 'cde'):
+                score, = translate_tune_batch(['K:C\n~G2|'], file_header, {'~G': macro},
+                                              cache=cache)
+                self.assertEqual(list(macro.upper()),
+                                 [n.step for n in score.flatten().notes])
+            self.assertEqual((0, 4), (cache.hits, cache.misses))
+
+    def test_memory_score_cache(self):
+        cache = MemoryScoreCache(maxsize=2)
+        score = abc_translator(testtunes.abc_pitch_octaves, cache=cache)
+        notes = len(score.flatten().notes)
+
+        # The caller may modify the score, the cached score stays untouched
+        score.parts[0].clear()
+        score = abc_translator(testtunes.abc_pitch_octaves.replace('\n', '  \r\n'), cache=cache)
+        self.assertEqual(notes, len(score.flatten().notes))
+        self.assertEqual(CacheInfo(hits=1, misses=1, maxsize=2, currsize=1), cache.info())
+
+        abc_translator(testtunes.tunebook_with_macros, cache=cache)
+        self.assertEqual(CacheInfo(hits=1, misses=4, maxsize=2, currsize=2), cache.info())
+
+        cache.resize(1)
+        self.assertEqual(1, len(cache))
+        cache.clear()
+        self.assertEqual(CacheInfo(hits=0, misses=0, maxsize=1, currsize=0), cache.info())
+
+        # Changing only a macro of the file header is a cache miss
+        tune_book = 'm: ~G = GAB\n\nX:1\nK:C\n~G2|\n'
+        for macro in ('GAB', 'cde'):
+            score = abc_translator(tune_book.replace('GAB', macro), cache=cache)
+            self.assertEqual(list(macro.upper()), [n.step for n in score.flatten().notes])
+        self.assertEqual(CacheInfo(hits=0, misses=2, maxsize=1, currsize=1), cache.info())
+
+    def test_translate_incremental(self):
+        with TemporaryDirectory() as tmp_dir:
+            tune_path = Path(tmp_dir) / 'tunebook.abc'
+            manifest_path = Path(tmp_dir) / 'manifest.json'
+            tune_path.write_text(testtunes.tunebook_with_macros)
+            cache = MemoryScoreCache()
+
+            result = translate_incremental(tune_path, manifest_path, cache)
+            self.assertEqual(['X: bla', 'X: 2', 'X: 2'], result.changed)
+            self.assertEqual(3, len(cache))
+
+            # Only the modified tune is translated again
+            tune_path.write_text(testtunes.tunebook_with_macros.replace('!>!C~C', '!>!D~C'))
+            result = translate_incremental(tune_path, manifest_path, cache)
+            self.assertEqual(['X: 2'], result.changed)
+            self.assertEqual(CacheInfo(hits=2, misses=4, maxsize=128, currsize=3), cache.info())
+            self.assertEqual('D', result.scores[1].flatten().notes[0].name)
+
+            # Changing the file header changes all tunes, also a change of a
+            # macro, a user-defined symbol or an instruction only
+            tune_book = 'C:Bach\n' + testtunes.tunebook_with_macros
+            for header_change in (('', ''), ('m: ~C={g}C', 'm: ~C={a}C'),
+                                  ('U: W = !trill!', 'U: W = !mordent!'),
+                                  ('T: titel_file', 'T: titel_file\nI:linebreak !')):
+                tune_book = tune_book.replace(*header_change)
+                tune_path.write_text(tune_book)
+                result = translate_incremental(tune_path, manifest_path, cache)
+                self.assertEqual(['X: bla', 'X: 2', 'X: 2'], result.changed)
+
+    def test_abc_translate_async(self):
+        async def translate_all(executor):
+            return [(ref, score.metadata.title)
+                    async for ref, score in aiter_abc_tunes(testtunes.tunebook_with_macros,
+                                                            executor, concurrency=2)]
+
+        async def translate_first(executor):
+            tunes = aiter_abc_tunes(testtunes.tunebook_with_macros, executor, concurrency=2)
+            async for ref, _ in tunes:
+                await tunes.aclose()
+                return ref
+
+        expected = [(ref, score.metadata.title)
+                    for ref, score in iter_abc_tunes(testtunes.tunebook_with_macros)]
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(expected, asyncio.run(translate_all(executor)))
+            self.assertEqual(expected[0][0], asyncio.run(translate_first(executor)))
+            opus = asyncio.run(abc_translate_async(testtunes.tunebook_with_macros, executor))
+
+        self.assertIsInstance(opus, stream.Opus)
+        self.assertEqual([title for _, title in expected],
+                         [score.metadata.title for score in opus.scores])
+
+        # An abc fragment from a file object is read only once
+        part = asyncio.run(abc_translate_async(io.StringIO('ABCD | EFGA')))
+        self.assertIsInstance(part, stream.Part)
+        self.assertEqual(8, len(part.flatten().notes))
+
+        # The scores of worker processes are thawed, the file header is not modified
+        def contexts(score):
+            return [(n.offset, n.measureNumber,
+                     n.getContextByClass(meter.TimeSignature).ratioString)
+                    for n in score.flatten().notes]
+
+        tune_book = 'M:3/4\n\nX:1\nK:G\nGAB cde|\n\nX:2\nK:D\nDFA|'
+        expected = [contexts(score) for _, score in iter_abc_tunes(tune_book)]
+        with ProcessPoolExecutor(2) as executor:
+            opus = asyncio.run(abc_translate_async(tune_book, executor, concurrency=2))
+            self.assertEqual(expected, [contexts(score) for score in opus.scores])
+            part = asyncio.run(abc_translate_async('M:3/4\nABC | DEF', executor))
+            self.assertEqual(contexts(abc_translator('M:3/4\nABC | DEF')), contexts(part))
+
+        # The tunes do not share the time signature of the file header
+        with ThreadPoolExecutor(2) as executor:
+            opus = asyncio.run(abc_translate_async(tune_book, executor, concurrency=2))
+        first, second = (score.recurse().getElementsByClass(meter.TimeSignature).first()
+                         for score in opus.scores)
+        self.assertEqual(first.ratioString, second.ratioString)
+        self.assertIsNot(first, second)
+
 
 if __name__ == '__main__':
     from pathlib import Path